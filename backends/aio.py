@@ -0,0 +1,149 @@
+import ssl, asyncio, json as _json
+from io import BytesIO
+from typing import Optional
+from base64 import b64encode
+from weakref import WeakKeyDictionary
+from functools import lru_cache
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from utils import STR_KEY_JSON, State, debug
+from btt_metrics import span
+from config import API_TOKEN, TIMEOUT
+
+NoInternetExceptions = (OSError, asyncio.TimeoutError) # includes HTTPError, as in the urllib backend
+
+@lru_cache(maxsize=None)
+def make_headers(api_token: str) -> str:
+    token = b64encode(f"{api_token}:api_token".encode("utf-8")).decode("utf-8")
+    return f"Authorization: Basic {token}\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n"
+
+
+class Pool:
+    """
+    Keep-alive HTTP/1.1 connections, reused across requests to the same host. At most `limit` requests
+    are in flight at once, and each one (including waiting for a connection) times out after `timeout` seconds.
+    Connections and the concurrency limit belong to the event loop they were made in, so each loop gets its own;
+    they are dropped with the loop, e.g. between two asyncio.run calls.
+    """
+
+    def __init__(self, limit: int=8, timeout: float=TIMEOUT):
+        self.limit = limit
+        self.timeout = timeout
+        # event loop -> (idle connections per (scheme, host, port), semaphore)
+        self.loops: WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[dict, asyncio.Semaphore]] = WeakKeyDictionary()
+        self.ssl_context: Optional[ssl.SSLContext] = None
+
+    def for_loop(self) -> tuple[dict[tuple[str, str, int], list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]], asyncio.Semaphore]:
+        """Idle connections and semaphore of the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self.loops:
+            self.loops[loop] = (dict(), asyncio.Semaphore(self.limit))
+        return self.loops[loop]
+
+    async def connect(self, scheme: str, host: str, port: int):
+        idle = self.for_loop()[0].get((scheme, host, port))
+        while idle:
+            reader, writer = idle.pop()
+            if not reader.at_eof() and not writer.is_closing(): return reader, writer, True
+            writer.close()
+        if scheme == "https" and self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        debug("Opening connection to %s:%s", host, port)
+        reader, writer = await asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == "https" else None)
+        return reader, writer, False
+
+    async def request(self, method: str, url: str, body: Optional[bytes]=None, token: str=API_TOKEN) -> bytes:
+        """Send one request and return the response body."""
+        async with self.for_loop()[1]:
+            return await asyncio.wait_for(self.send(method, url, body, token), self.timeout)
+
+    async def send(self, method: str, url: str, body: Optional[bytes], token: str) -> bytes:
+        parts = urlsplit(url)
+        scheme, host = parts.scheme, parts.hostname
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {parts.netloc}\r\n{make_headers(token)}"
+                f"Content-Length: {len(body or b'')}\r\n\r\n").encode("latin-1")
+
+        for attempt in range(2):
+            reader, writer, reused = await self.connect(scheme, host, port)
+            try:
+                writer.write(head + (body or b""))
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    # the server closed an idle keep-alive connection; retry once on a fresh one
+                    writer.close()
+                    if reused and attempt == 0: continue
+                    raise ConnectionError(f"{host} closed the connection")
+                _, _, status = status_line.decode("latin-1").strip().partition(" ") # HTTP/1.1 <status> <reason>
+                status, _, reason = status.partition(" ")
+                status, headers = int(status), await read_headers(reader)
+                data = await read_body(reader, headers)
+            except BaseException:
+                writer.close()
+                raise
+
+            if headers.get("connection", "").lower() == "close" or "content-length" not in headers and "chunked" not in headers.get("transfer-encoding", ""):
+                writer.close()
+            else:
+                self.for_loop()[0].setdefault((scheme, host, port), list()).append((reader, writer))
+            debug("%s %s -> %s", method, url, status)
+            if not 200 <= status < 300: # fail like the blocking backends do
+                raise HTTPError(url, status, reason, headers, BytesIO(data))
+            return data
+
+    async def close(self):
+        """Close the idle connections of the running event loop."""
+        idle = self.for_loop()[0]
+        for connections in idle.values():
+            for _, writer in connections: writer.close()
+        idle.clear()
+
+async def read_headers(reader: asyncio.StreamReader) -> dict[str, str]:
+    headers = dict()
+    while True:
+        line = (await reader.readline()).decode("latin-1").strip()
+        if not line: return headers
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+async def read_body(reader: asyncio.StreamReader, headers: dict[str, str]) -> bytes:
+    if "chunked" in headers.get("transfer-encoding", ""):
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                await read_headers(reader) # trailers
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+    return await reader.read()
+
+
+pool = Pool()
+
+def get_data(body: bytes) -> State:
+    with span("decode"):
+        return _json.loads(body, parse_int=str)
+
+async def get(url: str, token: str=API_TOKEN) -> State:
+    """ Send a GET request, including authentication, then return the result as json."""
+    return get_data(await pool.request("GET", url, token=token))
+
+async def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
+    """ Send a POST request with json data, including authentication, then return the result as json."""
+    return get_data(await pool.request("POST", url, _json.dumps(json).encode("utf-8"), token=token))
+
+async def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
+    """ Send a PUT request, including authentication, then return the result as json."""
+    body = _json.dumps(json).encode("utf-8") if json is not None else None
+    return get_data(await pool.request("PUT", url, body, token=token))
+
+async def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
+    """ Send a PATCH request with json data, including authentication, then return the result as json."""
+    body = _json.dumps(json).encode("utf-8") if json is not None else None
+    return get_data(await pool.request("PATCH", url, body, token=token))
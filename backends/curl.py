@@ -1,12 +1,13 @@
 import json as _json
-from subprocess import check_output, CalledProcessError
-from typing import Optional
+from subprocess import check_output, CalledProcessError, Popen, PIPE
+from typing import Optional, Callable
 
 from utils import STR_KEY_JSON, State, debug
+from btt_metrics import span
 from config import API_TOKEN
 
 CURL   = "curl -s "
-AUTH   = f"-u {API_TOKEN}:api_token "
+AUTH   = "-u {}:api_token "
 HEADER = '-H "Content-Type: application/json" '
 PREFIX = CURL + AUTH + HEADER
 
@@ -15,40 +16,57 @@ GET, POST, PUT, PATCH = "-X GET ", "-X POST ", "-X PUT ", "-X PATCH "
 
 NoInternetExceptions = (CalledProcessError,)
 
-def get(url: str) -> State:
+CHUNK_SIZE = 64 * 1024
+
+def run(command: str) -> State:
+    """ Run a curl command, then return its output as json."""
+    with span("http"):
+        out = check_output(command, shell=True)
+    with span("decode"):
+        resp: State = _json.loads(out.decode("utf-8"), parse_int=str)
+    return resp
+
+def get(url: str, token: str=API_TOKEN) -> State:
     """ Send a GET request, including authentication, then return the result as json."""
-    command = PREFIX + GET + url
+    command = PREFIX.format(token) + GET + url
     debug("Running command %s", command)
 
-    resp: State = _json.loads(check_output(command, shell=True).decode("utf-8"), parse_int=str)
-    return resp
+    return run(command)
 
-def post(url: str, json: STR_KEY_JSON) -> State:
+def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
     """ Send a POST request with json data, including authentication, then return the result as json."""
-    command = PREFIX + POST + DATA.format(_json.dumps(json)) + url
+    command = PREFIX.format(token) + POST + DATA.format(_json.dumps(json)) + url
     debug("Running command %s", command)
 
-    resp: State = _json.loads(check_output(command, shell=True).decode("utf-8"), parse_int=str)
-    return resp
+    return run(command)
 
-def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PUT request, including authentication, then return the result as json."""
     if json is not None:
-        command = PREFIX + PUT + DATA.format(_json.dumps(json)) + url
+        command = PREFIX.format(token) + PUT + DATA.format(_json.dumps(json)) + url
     else:
-        command = PREFIX + PUT + url
+        command = PREFIX.format(token) + PUT + url
     debug("Running command %s", command)
 
-    resp: State = _json.loads(check_output(command, shell=True).decode("utf-8"), parse_int=str)
-    return resp
+    return run(command)
 
-def patch(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PATCH request with json data, including authentication, then return the result as json."""
     if json is not None:
-        command = PREFIX + PATCH + DATA.format(_json.dumps(json)) + url
+        command = PREFIX.format(token) + PATCH + DATA.format(_json.dumps(json)) + url
     else:
-        command = PREFIX + PATCH + url
+        command = PREFIX.format(token) + PATCH + url
     debug("Running command %s", command)
 
-    resp: State = _json.loads(check_output(command, shell=True).decode("utf-8"), parse_int=str)
-    return resp
+    return run(command)
+
+def stream(url: str, on_chunk: Callable[[bytes], None], token: str=API_TOKEN) -> None:
+    """ Send a GET request, including authentication, passing the response body to `on_chunk` as it arrives."""
+    command = PREFIX.format(token) + GET + url
+    debug("Running command %s (streaming)", command)
+
+    with span("stream"), Popen(command, shell=True, stdout=PIPE) as proc:
+        while chunk := proc.stdout.read1(CHUNK_SIZE):
+            on_chunk(chunk)
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, command)
@@ -7,80 +7,194 @@ except ImportError as e:
     raise e
 
 from io import BytesIO
-from typing import Optional
+from typing import Optional, Callable
 from base64 import b64encode
+from functools import lru_cache
 
 from utils import STR_KEY_JSON, State, debug
+from btt_metrics import span
 from config import API_TOKEN, TIMEOUT
 
 NoInternetExceptions = (pc.error,)
 
-token = b64encode(f"{API_TOKEN}:api_token".encode("utf-8")).decode("utf-8")
-headers = ["Authorization: Basic %s" % token, "Content-Type: application/json"]
+@lru_cache(maxsize=None)
+def make_headers(api_token: str) -> list[str]:
+    token = b64encode(f"{api_token}:api_token".encode("utf-8")).decode("utf-8")
+    return ["Authorization: Basic %s" % token, "Content-Type: application/json"]
 
 
 def get_data(bio: BytesIO) -> State:
-    return _json.loads(bio.getvalue(), parse_int=str)
+    with span("decode"):
+        return _json.loads(bio.getvalue(), parse_int=str)
 
-def get(url: str) -> State:
+def get(url: str, token: str=API_TOKEN) -> State:
     """ Send a GET request, including authentication, then return the result as json."""
     debug("GET %s", url)
     c = pc.Curl()
     bio = BytesIO()
     c.setopt(pc.URL, url)
-    c.setopt(pc.HTTPHEADER, headers)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
     c.setopt(pc.TIMEOUT, TIMEOUT)
     c.setopt(pc.HTTPGET, 1)
     c.setopt(pc.WRITEDATA, bio)
-    c.perform()
+    with span("http"): c.perform()
     c.close()
     return get_data(bio)
 
-def post(url: str, json: STR_KEY_JSON) -> State:
+def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
     """ Send a POST request with json data, including authentication, then return the result as json."""
     debug("POST %s", url)
     c = pc.Curl()
     bio = BytesIO()
     c.setopt(pc.URL, url)
-    c.setopt(pc.HTTPHEADER, headers)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
     c.setopt(pc.TIMEOUT, TIMEOUT)
     c.setopt(pc.POST, 1)
     c.setopt(pc.POSTFIELDS, _json.dumps(json))
     c.setopt(pc.WRITEDATA, bio)
-    c.perform()
+    with span("http"): c.perform()
     c.close()
     return get_data(bio)
 
-def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PUT request, including authentication, then return the result as json."""
     debug("PUT %s", url)
     c = pc.Curl()
     bio = BytesIO()
     c.setopt(pc.URL, url)
-    c.setopt(pc.HTTPHEADER, headers)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
     c.setopt(pc.TIMEOUT, TIMEOUT)
     c.setopt(pc.CUSTOMREQUEST, "PUT")
     if json is not None:
         c.setopt(pc.POSTFIELDS, _json.dumps(json))
     c.setopt(pc.WRITEDATA, bio)
-    c.perform()
+    with span("http"): c.perform()
     c.close()
     return get_data(bio)
 
-def patch(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PATCH request with json data, including authentication, then return the result as json."""
     debug("PATCH %s", url)
     c = pc.Curl()
     bio = BytesIO()
     c.setopt(pc.URL, url)
-    c.setopt(pc.HTTPHEADER, headers)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
     c.setopt(pc.TIMEOUT, TIMEOUT)
     c.setopt(pc.CUSTOMREQUEST, "PATCH")
     if json is not None:
         c.setopt(pc.POSTFIELDS, _json.dumps(json))
     c.setopt(pc.WRITEDATA, bio)
-    c.perform()
+    with span("http"): c.perform()
     c.close()
     return get_data(bio)
 
+def stream(url: str, on_chunk: Callable[[bytes], None], token: str=API_TOKEN) -> None:
+    """ Send a GET request, including authentication, passing the response body to `on_chunk` as it arrives."""
+    debug("GET %s (streaming)", url)
+    c = pc.Curl()
+    c.setopt(pc.URL, url)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
+    c.setopt(pc.TIMEOUT, TIMEOUT)
+    c.setopt(pc.HTTPGET, 1)
+    errors = []
+    def write(chunk: bytes):
+        try:
+            on_chunk(chunk)
+        except Exception as e: # pycurl would only print it, so keep it to raise after aborting the transfer
+            errors.append(e)
+            return -1
+    c.setopt(pc.WRITEFUNCTION, write)
+    try:
+        with span("stream"): c.perform()
+    except pc.error:
+        if errors: raise errors[0]
+        raise
+    finally:
+        c.close()
+
+# libcurl built without nghttp2 rejects the HTTP_VERSION option, so multiplexed transfers then stay on HTTP/1.1
+HTTP2 = bool(pc.version_info()[4] & pc.VERSION_HTTP2)
+
+def multi_handle(url: str, token: str) -> pc.Curl:
+    """A handle for a transfer to be performed by perform_many, negotiating HTTP/2 if libcurl supports it."""
+    c = pc.Curl()
+    c.setopt(pc.URL, url)
+    c.setopt(pc.HTTPHEADER, make_headers(token))
+    c.setopt(pc.TIMEOUT, TIMEOUT)
+    if HTTP2:
+        c.setopt(pc.HTTP_VERSION, pc.CURL_HTTP_VERSION_2TLS if url.startswith("https") else pc.CURL_HTTP_VERSION_2_0)
+    c.setopt(pc.PIPEWAIT, 1) # wait to multiplex on a connection being set up instead of opening another
+    return c
+
+def perform_many(handles: list[pc.Curl]) -> None:
+    """Perform the transfers of `handles` at once, multiplexed over shared connections, and close them. Raises the first error."""
+    m = pc.CurlMulti()
+    m.setopt(pc.M_PIPELINING, pc.PIPE_MULTIPLEX)
+    for c in handles: m.add_handle(c)
+
+    try:
+        remaining = len(handles)
+        while remaining:
+            ret, remaining = m.perform()
+            if ret == pc.E_CALL_MULTI_PERFORM: continue
+            if remaining: m.select(1.0)
+
+        _, _, failed = m.info_read()
+    finally:
+        for c in handles:
+            debug("%s over HTTP/%s", c.getinfo(pc.EFFECTIVE_URL), {pc.CURL_HTTP_VERSION_2_0: "2"}.get(c.getinfo(pc.INFO_HTTP_VERSION), "1.1"))
+            m.remove_handle(c)
+            c.close()
+        m.close()
+
+    if failed:
+        _, errno, message = failed[0]
+        raise pc.error(errno, message)
+
+def request_many(calls: list[tuple[str, str, Optional[STR_KEY_JSON], str]]) -> list[State]:
+    """
+    Send several (method, url, json, token) requests at once and return their results as json, in order.
+    Requests to the same host share one HTTP/2 connection and are multiplexed over it. HTTP/2 is negotiated
+    via ALPN for https and via an h2c upgrade for http; servers that only speak HTTP/1.1 (or a libcurl
+    without HTTP/2 support) get one connection per request.
+    """
+    handles, bios = [], []
+    for method, url, json, token in calls:
+        debug("%s %s (multiplexed)", method, url)
+        c = multi_handle(url, token)
+        bio = BytesIO()
+        if method == "GET":
+            c.setopt(pc.HTTPGET, 1)
+        else:
+            c.setopt(pc.CUSTOMREQUEST, method)
+            if json is not None:
+                c.setopt(pc.POSTFIELDS, _json.dumps(json))
+        c.setopt(pc.WRITEDATA, bio)
+        handles.append(c)
+        bios.append(bio)
+
+    with span("http"): perform_many(handles)
+
+    return [get_data(bio) for bio in bios]
+
+def stream_many(calls: list[tuple[str, Callable[[bytes], None], str]]) -> None:
+    """ Send several (url, on_chunk, token) GET requests at once, multiplexed like request_many, passing each response body to its `on_chunk` as it arrives."""
+    handles, errors = [], []
+    for url, on_chunk, token in calls:
+        debug("GET %s (streaming, multiplexed)", url)
+        c = multi_handle(url, token)
+        c.setopt(pc.HTTPGET, 1)
+        def write(chunk: bytes, on_chunk=on_chunk):
+            try:
+                on_chunk(chunk)
+            except Exception as e: # pycurl would only print it, so keep it to raise after aborting the transfer
+                errors.append(e)
+                return -1
+        c.setopt(pc.WRITEFUNCTION, write)
+        handles.append(c)
 
+    try:
+        with span("stream"): perform_many(handles)
+    except pc.error:
+        if errors: raise errors[0]
+        raise
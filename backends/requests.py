@@ -1,5 +1,5 @@
 import os, sys
-from typing import Optional
+from typing import Optional, Callable
 
 try:
     import requests
@@ -8,28 +8,43 @@ except ImportError as e:
     raise e
 
 from utils import STR_KEY_JSON, State
+from btt_metrics import span
 from config import API_TOKEN, TIMEOUT
 
 session = requests.Session()
 
+CHUNK_SIZE = 64 * 1024
+
 NoInternetExceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
 
-def get(url: str) -> State:
+def get_data(resp: requests.Response) -> State:
+    """ Return the json data (if any) from a Response object."""
+    with span("decode"):
+        out: State = resp.json(parse_int=str)
+    return out
+
+def get(url: str, token: str=API_TOKEN) -> State:
     """ Send a GET request, including authentication, then return the result as json."""
-    resp: State = session.get(url, auth=(API_TOKEN, "api_token"), timeout=TIMEOUT).json(parse_int=str)
-    return resp
+    with span("http"): resp = session.get(url, auth=(token, "api_token"), timeout=TIMEOUT)
+    return get_data(resp)
 
-def post(url: str, json: STR_KEY_JSON) -> State:
+def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
     """ Send a POST request with json data, including authentication, then return the result as json."""
-    resp: State = session.post(url, auth=(API_TOKEN, "api_token"), timeout=TIMEOUT, json=json).json(parse_int=str)
-    return resp
+    with span("http"): resp = session.post(url, auth=(token, "api_token"), timeout=TIMEOUT, json=json)
+    return get_data(resp)
 
-def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PUT request, including authentication, then return the result as json."""
-    resp: State = session.put(url, auth=(API_TOKEN, "api_token"), timeout=TIMEOUT, json=json).json(parse_int=str)
-    return resp
+    with span("http"): resp = session.put(url, auth=(token, "api_token"), timeout=TIMEOUT, json=json)
+    return get_data(resp)
 
-def patch(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PATCH request with json data, including authentication, then return the result as json."""
-    resp: State = session.patch(url, auth=(API_TOKEN, "api_token"), timeout=TIMEOUT, json=json).json(parse_int=str)
-    return resp
+    with span("http"): resp = session.patch(url, auth=(token, "api_token"), timeout=TIMEOUT, json=json)
+    return get_data(resp)
+
+def stream(url: str, on_chunk: Callable[[bytes], None], token: str=API_TOKEN) -> None:
+    """ Send a GET request, including authentication, passing the response body to `on_chunk` as it arrives."""
+    with span("stream"), session.get(url, auth=(token, "api_token"), timeout=TIMEOUT, stream=True) as resp:
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            on_chunk(chunk)
@@ -1,37 +1,45 @@
 import json as _json
-from typing import Optional
+from typing import Optional, Callable
 from base64 import b64encode
+from functools import lru_cache
 
 from utils import STR_KEY_JSON, State, debug
+from btt_metrics import span
 from config import API_TOKEN, TIMEOUT
 
-token = b64encode(f"{API_TOKEN}:api_token".encode("utf-8")).decode("utf-8")
-headers = {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
+@lru_cache(maxsize=None)
+def make_headers(api_token: str) -> dict[str, str]:
+    token = b64encode(f"{api_token}:api_token".encode("utf-8")).decode("utf-8")
+    return {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
 
 import urllib.request, urllib.error, urllib.parse
 
 NoInternetExceptions = (urllib.error.URLError, urllib.error.HTTPError)
 
+CHUNK_SIZE = 64 * 1024
+
 def do_request(req: urllib.request.Request) -> State:
-    with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
-        resp: State = _json.loads(resp.read(), parse_int=str)
+    with span("http"), urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        body = resp.read()
+    with span("decode"):
+        resp: State = _json.loads(body, parse_int=str)
     return resp
 
-def get(url: str) -> State:
+def get(url: str, token: str=API_TOKEN) -> State:
     """ Send a GET request, including authentication, then return the result as json."""
-    req = urllib.request.Request(url, headers=headers, method="GET")
+    req = urllib.request.Request(url, headers=make_headers(token), method="GET")
     debug("GET %s", url)
     return do_request(req)
 
-def post(url: str, json: STR_KEY_JSON) -> State:
+def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
     """ Send a POST request with json data, including authentication, then return the result as json."""
-    req = urllib.request.Request(url, headers=headers, method="POST", data=_json.dumps(json).encode("utf-8"))
+    req = urllib.request.Request(url, headers=make_headers(token), method="POST", data=_json.dumps(json).encode("utf-8"))
     debug("POST %s", url)
     return do_request(req)
 
-def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PUT request, including authentication, then return the result as json."""
-    kwargs = dict(headers=headers, method="PUT")
+    kwargs = dict(headers=make_headers(token), method="PUT")
     if json is not None:
         kwargs['data'] = _json.dumps(json).encode("utf-8")
 
@@ -39,12 +47,20 @@ def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
     debug("PUT %s", url)
     return do_request(req)
 
-def patch(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PATCH request with json data, including authentication, then return the result as json."""
-    kwargs = dict(headers=headers, method="PATCH")
+    kwargs = dict(headers=make_headers(token), method="PATCH")
     if json is not None:
         kwargs['data'] = _json.dumps(json).encode("utf-8")
 
     req = urllib.request.Request(url, **kwargs)
     debug("PATCH %s", url)
     return do_request(req)
+
+def stream(url: str, on_chunk: Callable[[bytes], None], token: str=API_TOKEN) -> None:
+    """ Send a GET request, including authentication, passing the response body to `on_chunk` as it arrives."""
+    req = urllib.request.Request(url, headers=make_headers(token), method="GET")
+    debug("GET %s (streaming)", url)
+    with span("stream"), urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        while chunk := resp.read(CHUNK_SIZE):
+            on_chunk(chunk)
@@ -1,6 +1,7 @@
 import os, sys, json as _json
-from typing import Optional
+from typing import Optional, Callable
 from base64 import b64encode
+from functools import lru_cache
 
 try:
     import urllib3, urllib3.exceptions, urllib3.poolmanager
@@ -9,47 +10,64 @@ except ImportError as e:
     raise e
 
 from utils import STR_KEY_JSON, State, debug
+from btt_metrics import span
 from config import API_TOKEN, TIMEOUT
 
-token = b64encode(f"{API_TOKEN}:api_token".encode("utf-8")).decode("utf-8")
-headers = {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
+@lru_cache(maxsize=None)
+def make_headers(api_token: str) -> dict[str, str]:
+    token = b64encode(f"{api_token}:api_token".encode("utf-8")).decode("utf-8")
+    return {"Authorization": f"Basic {token}", "Content-Type": "application/json"}
 
 NoInternetExceptions = (urllib3.exceptions.NewConnectionError, urllib3.exceptions.MaxRetryError)
 if "--debug" not in sys.argv and "--info" not in sys.argv: urllib3.disable_warnings()
 
 http = urllib3.poolmanager.PoolManager()
 
+CHUNK_SIZE = 64 * 1024
+
 def get_data(resp: urllib3.HTTPResponse) -> State:
     """ Return the json data (if any) from a HTTPResponse object."""
-    out: State = _json.loads(resp.data.decode("utf-8"), parse_int=str)
+    with span("decode"):
+        out: State = _json.loads(resp.data.decode("utf-8"), parse_int=str)
     return out
 
-def get(url: str) -> State:
+def get(url: str, token: str=API_TOKEN) -> State:
     """ Send a GET request, including authentication, then return the result as json."""
     debug("GET %s", url)
-    resp: urllib3.HTTPResponse = http.request("GET", url, headers=headers, timeout=TIMEOUT)
+    with span("http"): resp: urllib3.HTTPResponse = http.request("GET", url, headers=make_headers(token), timeout=TIMEOUT)
     return get_data(resp)
 
-def post(url: str, json: STR_KEY_JSON) -> State:
+def post(url: str, json: STR_KEY_JSON, token: str=API_TOKEN) -> State:
     """ Send a POST request with json data, including authentication, then return the result as json."""
     debug("POST %s", url)
-    resp: urllib3.HTTPResponse = http.request("POST", url, headers=headers, timeout=TIMEOUT, body=_json.dumps(json))
+    with span("http"): resp: urllib3.HTTPResponse = http.request("POST", url, headers=make_headers(token), timeout=TIMEOUT, body=_json.dumps(json))
     return get_data(resp)
 
-def put(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def put(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PUT request, including authentication, then return the result as json."""
     debug("PUT %s", url)
-    kwargs = dict(headers=headers, timeout=TIMEOUT)
+    kwargs = dict(headers=make_headers(token), timeout=TIMEOUT)
     if json is not None:
         kwargs['body'] = _json.dumps(json)
-    resp: urllib3.HTTPResponse = http.request("PUT", url, **kwargs)
+    with span("http"): resp: urllib3.HTTPResponse = http.request("PUT", url, **kwargs)
     return get_data(resp)
 
-def patch(url: str, json: Optional[STR_KEY_JSON]=None) -> State:
+def patch(url: str, json: Optional[STR_KEY_JSON]=None, token: str=API_TOKEN) -> State:
     """ Send a PATCH request with json data, including authentication, then return the result as json."""
     debug("PATCH %s", url)
-    kwargs = dict(headers=headers, timeout=TIMEOUT)
+    kwargs = dict(headers=make_headers(token), timeout=TIMEOUT)
     if json is not None:
         kwargs['body'] = _json.dumps(json)
-    resp: urllib3.HTTPResponse = http.request("PATCH", url, **kwargs)
+    with span("http"): resp: urllib3.HTTPResponse = http.request("PATCH", url, **kwargs)
     return get_data(resp)
+
+def stream(url: str, on_chunk: Callable[[bytes], None], token: str=API_TOKEN) -> None:
+    """ Send a GET request, including authentication, passing the response body to `on_chunk` as it arrives."""
+    debug("GET %s (streaming)", url)
+    with span("stream"):
+        resp: urllib3.HTTPResponse = http.request("GET", url, headers=make_headers(token), timeout=TIMEOUT, preload_content=False)
+        try:
+            for chunk in resp.stream(CHUNK_SIZE):
+                on_chunk(chunk)
+        finally:
+            resp.release_conn()
@@ -5,11 +5,15 @@ from typing import Optional
 from traceback import format_exc
 from argparse import ArgumentParser
 
-from utils import make_status, send_to_btt, USAGE, debug
-from btt_cache import read_cache, read_cache_tag, write_cache
-from toggl_api import get_current, toggle, start, stop, toggle_tag, add_tag, remove_tag, get_project_dict, NoInternetExceptions
+from btt_metrics import span, record, stats
 
-from config import PATH_TO_ACTIVE_IMG, PATH_TO_INACTIVE_IMG, WID_PID_DICT, VALIDATION, TAG_ACTIVE_BACKGROUND_RGB, TAG_INACTIVE_BACKGROUND_RGB
+with span("import"):
+    from utils import make_status, send_to_btt, USAGE, WID_PID_DICT, debug
+    from btt_cache import read_cache, read_cache_tag, write_cache
+    from toggl_api import get_current, get_current_all, toggle, start, stop, toggle_tag, add_tag, remove_tag, get_project_dict, NoInternetExceptions
+    from btt_batch import batch
+
+    from config import PATH_TO_ACTIVE_IMG, PATH_TO_INACTIVE_IMG, VALIDATION, TAG_ACTIVE_BACKGROUND_RGB, TAG_INACTIVE_BACKGROUND_RGB
 
 if "--no-validation" in sys.argv:
     debug("Validation disabled")
@@ -18,13 +22,13 @@ if "--no-validation" in sys.argv:
 debug("Imports/Setup done")
 
 
-def main(general: bool, mode: str, wid: Optional[str]=None, pid: Optional[str]=None, tag: Optional[str]=None) -> None:
+def main(general: bool, mode: str, wid: Optional[str]=None, pid: Optional[str]=None, tag: Optional[str]=None, ops: Optional[list[str]]=None) -> None:
     # status is used to change BTT widget icons/text, so we print to stdout
     if mode == "status":
         if general and tag is None:
             debug("Getting general status with no tag")
-            # rewrite cache on general/tag-only status
-            send_to_btt(make_status(write_cache(get_current()), general, wid, pid, tag))
+            # rewrite cache on general/tag-only status, with the current entry of every account
+            send_to_btt(make_status(write_cache(*get_current_all()), general, wid, pid, tag))
         else:
             debug("Getting non-general status")
             # read from cache for non-general status
@@ -54,11 +58,18 @@ def main(general: bool, mode: str, wid: Optional[str]=None, pid: Optional[str]=N
         return start(wid, pid, tag)
     elif mode == "stop":
         return stop()
+    elif mode == "batch":
+        # operations from argv, or one per line on stdin if given "-" (BTT can leave stdin open, so it is never read otherwise)
+        if "-" in ops:
+            i = ops.index("-")
+            ops = ops[:i] + sys.stdin.read().splitlines() + ops[i + 1:]
+        return batch(ops, validate=VALIDATION)
 
 
 if __name__ == "__main__":
     parser = ArgumentParser(usage=USAGE, prog='btt-toggl', description=" Quick and easy time tracking in the touch bar with Toggl API v9 and BetterTouchTool")
-    parser.add_argument("mode", choices=["status", "toggle", "start", "stop", "add_tag", "remove_tag", "toggle_tag", "get_project_dict"])
+    parser.add_argument("mode", choices=["status", "toggle", "start", "stop", "add_tag", "remove_tag", "toggle_tag", "get_project_dict", "stats", "batch"])
+    parser.add_argument("ops", nargs="*", help="operations to run in batch mode, e.g. \"start -w <wid> -p <pid>\" \"add_tag -t <tag>\", or - to read them from stdin")
     parser.add_argument("-w", "--wid", type=str, help="workspace ID")
     parser.add_argument("-p", "--pid", type=str, help="project ID")
     parser.add_argument("-t", "--tag", type=str, help="tag to add to current/new entry")
@@ -70,7 +81,11 @@ if __name__ == "__main__":
     parser.add_argument("--urllib3", action="store_true", help="use urllib3 backend")
     parser.add_argument("--pycurl", action="store_true", help="use pycurl backend")
     parser.add_argument("--no-validation", action="store_true", help="disable validation of args")
+    parser.add_argument("--metrics", action="store_true", help="append per-phase timings to the metrics log")
+    parser.add_argument("--window", type=float, default=60.0, help="minutes of metrics to summarize in stats mode")
     args = parser.parse_args()
+    if args.ops and args.mode != "batch":
+        parser.error(f"unrecognized arguments: {' '.join(args.ops)} (operations are only used in batch mode)")
     mode = args.mode
     pid = args.pid
     wid = args.wid
@@ -90,22 +105,27 @@ if __name__ == "__main__":
                 mode in ["status", "add_tag", "start", "toggle", "remove_tag", "toggle_tag"],
                 f"Tag must not be set in {mode} mode\n",
             )
+        if mode == "batch":
+            assert_false(
+                bool(args.ops),
+                f"Operations (or - to read them from stdin) must be set in {mode} mode\n",
+            )
         if mode == "start":
             assert_false(
                 (wid is not None) and (pid is not None),
                 f"Workspace ID and Project ID must be set in {mode} mode\n",
             )
-        elif mode in ["add_tag", "remove_tag", "toggle_tag", "get_project_dict"]:
+        elif mode in ["add_tag", "remove_tag", "toggle_tag", "get_project_dict", "stats", "batch"]:
             assert_false(
                 (wid is None) and (pid is None),
                 f"Workspace ID and Project ID are not used in {mode} mode\n",
             )
         if general:
             assert_false(
-                mode in ["status", "stop", "add_tag", "remove_tag", "toggle_tag", "get_project_dict"],
+                mode in ["status", "stop", "add_tag", "remove_tag", "toggle_tag", "get_project_dict", "stats", "batch"],
                 f"Workspace ID and Project ID must be set in {mode} mode\n",
             )
-        elif not mode == "get_project_dict":
+        elif mode not in ["get_project_dict", "stats"]:
             assert_false(
                 wid in WID_PID_DICT.keys(),
                 f"Workspace ID {wid} not found. Make sure WID_PID_DICT is correct in config.py\n",
@@ -126,8 +146,12 @@ if __name__ == "__main__":
         if mode == "get_project_dict":
             debug("Ignoring other args and returning project dict")
             get_project_dict()
+        elif mode == "stats":
+            debug("Summarizing metrics from the last %s minutes", args.window)
+            stats(args.window)
         else:
-            main(general, mode, wid, pid, tag)
+            with span("main"):
+                main(general, mode, wid, pid, tag, args.ops)
 
     except json.JSONDecodeError as e: # non-json response from Toggl API
         msg = "Did you change your API key? Make sure it's correct in config.py"
@@ -144,3 +168,5 @@ if __name__ == "__main__":
         msg = "Something unexpected went wrong. Please report this error at https://github.com/klamike/btt-toggl/issues"
         print(f"\n{msg}\n{format_exc()}\n{msg}\n", file=sys.stderr)
 
+    # e.g. "status", "status -w -p", "status -t", "toggle -t"
+    if mode != "stats": record(" ".join([mode] + [flag for flag, value in (("-w", wid), ("-p", pid), ("-t", tag)) if value]))
@@ -0,0 +1,150 @@
+import shlex
+
+from typing import Optional
+from collections import Counter
+from argparse import ArgumentParser
+
+from utils import State, WID_PID_DICT, wid_pid_tag_match, debug
+from toggl_api import post, put, patch, get_current
+from toggl_actions import cache_action, on_account, start_tags, start_request, stop_request, tags_request, with_tag, without_tag
+
+OPS = ["toggle", "start", "stop", "add_tag", "remove_tag", "toggle_tag"]
+
+Op = tuple[str, Optional[str], Optional[str], Optional[str]] # (mode, wid, pid, tag)
+
+
+def parse_ops(lines: list[str], validate: bool=True) -> list[Op]:
+    """
+    Parse operations like `start -w <wid> -p <pid> -t <tag>`, one per line/argument or separated by `;`.
+    With `validate`, workspace/project IDs must be in WID_PID_DICT, as in the single-operation modes.
+    """
+    parser = ArgumentParser(prog="btt-toggl batch", add_help=False)
+    parser.add_argument("mode", choices=OPS)
+    parser.add_argument("-w", "--wid", type=str)
+    parser.add_argument("-p", "--pid", type=str)
+    parser.add_argument("-t", "--tag", type=str)
+
+    ops: list[Op] = []
+    for line in lines:
+        for op in line.split(";"):
+            if not op.strip(): continue
+            args = parser.parse_args(shlex.split(op))
+            if args.mode in ["start", "toggle"] and not (args.wid and args.pid):
+                parser.error(f"Workspace ID and Project ID must be set in {args.mode} mode")
+            if validate and args.wid is not None and args.wid not in WID_PID_DICT:
+                parser.error(f"Workspace ID {args.wid} not found. Make sure WID_PID_DICT is correct in config.py")
+            if validate and args.pid is not None and args.pid not in WID_PID_DICT.get(args.wid, dict()):
+                parser.error(f"Project ID {args.pid} not found under workspace {args.wid}. Make sure WID_PID_DICT is correct in config.py")
+            if args.mode in ["add_tag", "remove_tag", "toggle_tag"] and not args.tag:
+                parser.error(f"Tag must be set in {args.mode} mode")
+            ops.append((args.mode, args.wid, args.pid, args.tag))
+    return ops
+
+
+class Batch:
+    """
+    Plans a sequence of operations against a local model of the current entry, sending a request only
+    when Toggl has to see it: tag edits are merged into one PUT of the final tag list (or folded into
+    the POST of a pending start), and edits that cancel out send nothing.
+    """
+
+    def __init__(self):
+        self.entry: State = None            # current entry as last returned by Toggl
+        self.fetched = False                # whether self.entry has been fetched/returned from Toggl
+        self.tags: Optional[list[str]] = None # tags self.entry should have, if edited since it was fetched
+        self.pending: Optional[dict] = None # start not sent yet: {workspace_id, project_id, tags}
+        self.stopped: list[dict] = list()   # entries stopped so far
+        self.requests = 0
+
+    def running(self) -> State:
+        """What will be running once everything planned so far is sent."""
+        if self.pending is not None: return self.pending
+        if not self.fetched:
+            self.entry, self.fetched = get_current(), True
+            self.requests += 1
+        if self.entry is None: return None
+        return self.entry if self.tags is None else dict(self.entry, tags=self.tags)
+
+    def flush(self):
+        """Send the pending start, or the merged tag edits of the current entry."""
+        if self.pending is not None:
+            wid, pid = self.pending["workspace_id"], self.pending["project_id"]
+            debug("POST start (%s, %s) with tags %s", wid, pid, self.pending["tags"])
+            url, json, token = start_request(wid, pid, self.pending["tags"])
+            self.entry, self.fetched = on_account(post(url, json, token=token), token), True
+            self.pending = None
+            self.requests += 1
+        elif self.entry is not None and self.tags is not None:
+            # compared as multisets, so edits that only move a tag (e.g. removing and re-adding it) send nothing
+            if Counter(self.tags) != Counter(self.entry.get("tags") or list()):
+                debug("PUT tags %s", self.tags)
+                url, json, token = tags_request(self.entry, self.tags)
+                self.entry = on_account(put(url, json, token=token), token)
+                self.requests += 1
+            else:
+                debug("Tag edits cancel out, not sending")
+        self.tags = None
+
+    def set_tags(self, tags: list[str]):
+        if self.pending is not None:
+            self.pending["tags"] = tags
+        else:
+            self.tags = tags
+
+    def start(self, wid: str, pid: str, tag: Optional[str]=None):
+        self.flush()
+        self.pending = dict(workspace_id=wid, project_id=pid, tags=start_tags(tag))
+
+    def stop(self):
+        if self.running() is None: return
+        self.flush()
+        debug("PATCH stop %s", self.entry["id"])
+        url, token = stop_request(self.entry)
+        patch(url, token=token)
+        self.stopped.append(self.entry)
+        self.entry, self.fetched = None, True
+        self.requests += 1
+
+    def toggle(self, wid: str, pid: str, tag: Optional[str]=None):
+        running = self.running()
+        if running is not None:
+            self.stop()
+            if wid_pid_tag_match(running, wid, pid, tag): return
+        self.start(wid, pid, tag)
+
+    def add_tag(self, tag: str):
+        running = self.running()
+        if running is None: return
+        self.set_tags(with_tag(running, tag))
+
+    def remove_tag(self, tag: str):
+        running = self.running()
+        if running is None: return
+        self.set_tags(without_tag(running, tag))
+
+    def toggle_tag(self, tag: str):
+        running = self.running()
+        if running is None: return
+        if wid_pid_tag_match(running, tag=tag):
+            self.remove_tag(tag)
+        else:
+            self.add_tag(tag)
+
+    def run(self, ops: list[Op]) -> State:
+        """Plan and send `ops`, then write the cache once."""
+        for mode, wid, pid, tag in ops:
+            debug("Batch op %s (%s, %s, %s)", mode, wid, pid, tag)
+            if mode == "start":        self.start(wid, pid, tag)
+            elif mode == "stop":       self.stop()
+            elif mode == "toggle":     self.toggle(wid, pid, tag)
+            elif mode == "add_tag":    self.add_tag(tag)
+            elif mode == "remove_tag": self.remove_tag(tag)
+            elif mode == "toggle_tag": self.toggle_tag(tag)
+        self.flush()
+        debug("Batch of %s ops sent %s requests", len(ops), self.requests)
+
+        return cache_action(self.entry, *self.stopped) if self.fetched else self.entry
+
+def batch(lines: list[str], validate: bool=True) -> State:
+    """Run the operations in `lines` as one batch."""
+    return Batch().run(parse_ops(lines, validate))
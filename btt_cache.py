@@ -1,33 +1,52 @@
 import json
 
-from utils import make_status, State, CACHE_TYPE, debug
-from config import WID_PID_DICT, PATH_TO_CACHE_FILE
+from utils import render_status, State, CACHE_TYPE, WID_PID_DICT, API_TOKENS, debug
+from btt_metrics import span
+from config import PATH_TO_CACHE_FILE
 
+ENTRY_FIELDS = ("id", "workspace_id", "project_id", "tags", "start", "account") # what the cache remembers of each running entry
 
-def write_cache(state: State):
-    """Write the current state of each project to the cache file."""
+
+def write_cache(state: State, *others: State):
+    """Write the current state of each project to the cache file. `others` are the current entries of other accounts, if any."""
     debug("Making cache")
+    states = [s for s in (state, *others) if s is not None]
+    # a project is active iff some current entry is logging it, so one set lookup replaces matching each entry
+    active = {(s.get("workspace_id"), s.get("project_id")) for s in states}
+
     d: CACHE_TYPE = dict()
-    for wid, pids in WID_PID_DICT.items():
-        d[wid] = {}
-        for pid in pids.keys():
-            d[wid][pid] = make_status(state, False, wid, pid)
+    with span("cache_build"):
+        for wid, pids in WID_PID_DICT.items():
+            d[wid] = {pid: render_status(wid, pid, None, (wid, pid) in active) for pid in pids}
 
-    if state is not None:
+    if states:
         debug("Adding active tags to cache")
-        d["tags"] = state.get("tags", list())
+        d["tags"] = list(dict.fromkeys(tag for s in states for tag in (s.get("tags") or list())))
         debug("Tags: %s", str(d['tags']))
 
+    if len(API_TOKENS) > 1:
+        # remembered so that an action on one account can rewrite the cache without losing the others' entries
+        d["entries"] = [{field: s.get(field) for field in ENTRY_FIELDS} for s in states if not s.get("stop")]
+
     debug("Writing to cache")
-    with open(PATH_TO_CACHE_FILE, "w") as f: json.dump(d, f)
+    with span("cache_write"), open(PATH_TO_CACHE_FILE, "w") as f: json.dump(d, f)
     debug("Done writing to cache")
 
     return state
 
+def read_cache_entries() -> list[dict]:
+    """The running entries (of every account) as of the last cache write, if any were recorded."""
+    debug("Reading entries from cache")
+    try:
+        with span("cache_read"), open(PATH_TO_CACHE_FILE, "r") as f:
+            return json.load(f).get("entries", list())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return list()
+
 def read_cache(wid: str, pid: str):
     """Read the current style string of a project from the cache file."""
     debug("Reading from cache (%s, %s)", wid, pid)
-    with open(PATH_TO_CACHE_FILE, "r") as f:
+    with span("cache_read"), open(PATH_TO_CACHE_FILE, "r") as f:
         out_dict: CACHE_TYPE = json.load(f)
         return out_dict[wid][pid]
 
@@ -35,7 +54,7 @@ def read_cache_tag(tag: str):
     """Checking if a tag is in the cache file."""
     debug("Looking for %s in cache", tag)
 
-    with open(PATH_TO_CACHE_FILE, "r") as f:
+    with span("cache_read"), open(PATH_TO_CACHE_FILE, "r") as f:
         out_dict: CACHE_TYPE = json.load(f)
         match = tag in out_dict.get("tags", list())
         debug("Found %s in cache" if match else "No %s in cache", tag)
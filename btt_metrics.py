@@ -0,0 +1,113 @@
+import sys, time
+
+# process CPU time consumed before the first line of btt-toggl.py ran, i.e. interpreter startup
+STARTUP_CPU = time.process_time()
+
+ENABLED = "--metrics" in sys.argv
+
+# phase name -> seconds spent in that phase during this invocation (spans are inclusive, so "import" includes "import_backend")
+PHASES: dict[str, float] = dict()
+
+
+if ENABLED:
+    from time import perf_counter
+    from threading import get_ident, main_thread
+
+    MAIN_THREAD = main_thread().ident
+
+    class span:
+        """
+        Context manager adding the wall time of its body to PHASES[phase]. Only spans on the main thread count:
+        concurrent requests on worker threads would overlap, so their caller times the whole batch in one span instead.
+        """
+        __slots__ = ("phase", "start")
+
+        def __init__(self, phase: str):
+            self.phase = phase
+
+        def __enter__(self):
+            self.start = perf_counter()
+
+        def __exit__(self, *exc):
+            if get_ident() != MAIN_THREAD: return
+            PHASES[self.phase] = PHASES.get(self.phase, 0.0) + perf_counter() - self.start
+else:
+    class _NoSpan:
+        __slots__ = ()
+        def __enter__(self): pass
+        def __exit__(self, *exc): pass
+
+    _NO_SPAN = _NoSpan()
+
+    def span(phase: str): return _NO_SPAN
+
+
+def metrics_path() -> str:
+    """Path to the NDJSON metrics log. Defaults to metrics.ndjson next to the cache file."""
+    try:
+        from config import PATH_TO_METRICS_FILE
+    except ImportError:
+        from os.path import join, dirname
+        from config import PATH_TO_CACHE_FILE
+        PATH_TO_METRICS_FILE = join(dirname(PATH_TO_CACHE_FILE), "metrics.ndjson")
+    return PATH_TO_METRICS_FILE
+
+def max_bytes() -> int:
+    try:
+        from config import METRICS_MAX_BYTES
+    except ImportError:
+        METRICS_MAX_BYTES = 1_000_000
+    return METRICS_MAX_BYTES
+
+def record(mode: str):
+    """Append the phases of this invocation to the metrics log, rotating it once it grows past METRICS_MAX_BYTES."""
+    if not ENABLED: return
+    import os, json
+
+    path = metrics_path()
+    try:
+        if os.path.getsize(path) > max_bytes():
+            os.replace(path, path + ".1")
+    except FileNotFoundError:
+        pass
+
+    line = json.dumps({"t": round(time.time(), 3), "mode": mode, "startup_cpu": round(STARTUP_CPU, 6),
+                       "phases": {k: round(v, 6) for k, v in PHASES.items()}})
+    with open(path, "a") as f: f.write(line + "\n")
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    from math import ceil
+    return values[max(0, ceil(p / 100 * len(values)) - 1)]
+
+def stats(window: float = 60.0):
+    """Print p50/p95/p99 per mode and phase (in milliseconds) for entries logged in the last `window` minutes."""
+    import os, json
+
+    path = metrics_path()
+    since = time.time() - window * 60
+    samples: dict[tuple[str, str], list[float]] = dict()
+    for p in (path + ".1", path):
+        if not os.path.isfile(p): continue
+        with open(p, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError: # partially written line
+                    continue
+                if entry["t"] < since: continue
+                samples.setdefault((entry["mode"], "startup_cpu"), list()).append(entry["startup_cpu"])
+                for phase, seconds in entry["phases"].items():
+                    samples.setdefault((entry["mode"], phase), list()).append(seconds)
+
+    if not samples:
+        print(f"No metrics in the last {window:g} minutes. Run btt-toggl.py with --metrics to record them (log: {path}).", flush=True)
+        return samples
+
+    print(f"{'mode':<24}{'phase':<18}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for (mode, phase), values in sorted(samples.items()):
+        values.sort()
+        p50, p95, p99 = (1000 * percentile(values, p) for p in (50, 95, 99))
+        print(f"{mode:<24}{phase:<18}{len(values):>7}{p50:>10.2f}{p95:>10.2f}{p99:>10.2f}")
+    sys.stdout.flush()
+    return samples
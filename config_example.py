@@ -13,6 +13,11 @@ PATH_TO_INACTIVE_IMG = (this_directory / 'images' / 'inactive.png').as_posix()
 # for speed, replace this with a literal string paths to the cache file
 PATH_TO_CACHE_FILE = (this_directory / 'cache.json').as_posix()
 
+# Path to the metrics log written when running with --metrics (summarize it with `btt-toggl.py stats`).
+# once it grows past METRICS_MAX_BYTES, it is moved to <path>.1 and a new log is started.
+PATH_TO_METRICS_FILE = (this_directory / 'metrics.ndjson').as_posix()
+METRICS_MAX_BYTES = 1_000_000
+
 # The background color (RGB) set when asking for general tag status
 TAG_ACTIVE_BACKGROUND_RGB = "223,51,54"
 TAG_INACTIVE_BACKGROUND_RGB = "85,85,85"
@@ -25,6 +30,13 @@ WID_PID_DICT: dict[str, dict[str, str]] = {'1000000':{'100000001':'W1 P1',
                                            '2000000':{'200000001':'W2 P1',
                                                       '200000002':'W2 P2'}}
 
+# Optional: more Toggl accounts, each with its own API token and projects. They are used alongside
+# API_TOKEN/WID_PID_DICT above, and the general status fetches every account's current entry concurrently.
+# ACCOUNTS = {<name>: {'API_TOKEN': <token>, 'WID_PID_DICT': {<wid>: {<pid>: <display name>, ...}, ...}}, ...}
+# a workspace listed by several accounts shows all of their projects. entries are started on the account listing
+# the project, and running entries are stopped/tagged on the account they were fetched from.
+ACCOUNTS: dict[str, dict] = {}
+
 # by default, btt-toggl will apply the tag "btt-toggl" to all entries it creates
 TAG_ALL_ENTRIES = True
 
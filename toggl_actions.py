@@ -0,0 +1,95 @@
+"""
+The parts of the Toggl actions that do no I/O: URLs, request bodies, tag lists, which account's API token to
+use, and writing the cache afterwards. Shared by toggl_api, toggl_async and btt_batch, so that only the I/O
+differs between them, and importable without loading any backend.
+"""
+import os
+
+from typing import Optional
+
+from btt_cache import write_cache, read_cache_entries
+from config import TAG_ALL_ENTRIES
+from utils import State, STR_KEY_JSON, TOKENS, PROJECT_TOKENS, API_TOKENS, debug
+
+# BTT_TOGGL_API can point btt-toggl at another server, e.g. the fake API used by tools/load_sim.py
+API = os.environ.get("BTT_TOGGL_API", "https://api.track.toggl.com/api/v9")
+TIME_ENTRY = API + "/workspaces/{}/time_entries/{}"
+CURRENT = API + "/me/time_entries/current"
+START = API + "/workspaces/{}/time_entries"
+STOP = API + "/workspaces/{}/time_entries/{}/stop"
+PROJECTS = API + "/me/projects"
+
+ACCOUNT = "account" # key of the index (in API_TOKENS) of the account an entry was fetched from or sent with
+
+def token_for(wid: str, pid: Optional[str]=None) -> str:
+    """The API token of the account listing project (wid, pid), or else workspace `wid`, in its WID_PID_DICT."""
+    return PROJECT_TOKENS.get((str(wid), str(pid))) or TOKENS.get(str(wid), API_TOKENS[0])
+
+def token_of(state: STR_KEY_JSON) -> str:
+    """The API token of the account `state` belongs to: the one it was fetched with, if known, otherwise the one listing its project."""
+    account = state.get(ACCOUNT)
+    if account is not None and account < len(API_TOKENS): return API_TOKENS[account]
+    return token_for(state["workspace_id"], state.get("project_id"))
+
+def on_account(state: State, token: str) -> State:
+    """Mark `state` (if any) as an entry of the account of `token`."""
+    if state is not None: state[ACCOUNT] = API_TOKENS.index(token)
+    return state
+
+def cache_action(state: State, *stopped: State) -> State:
+    """
+    Write the cache after an action that left `state` running (or None), having stopped the entries in `stopped`.
+    With several accounts, the entries of the accounts not touched by the action are kept as of the last cache
+    write, so their projects stay active until the next general status.
+    """
+    if len(API_TOKENS) == 1: return write_cache(state)
+
+    tokens = {token_of(s) for s in (state, *stopped) if s is not None}
+    others = [entry for entry in read_cache_entries() if token_of(entry) not in tokens]
+    debug("Keeping %s cached entries of other accounts", len(others))
+    return write_cache(state, *others)
+
+def newest_first(states: list[State]) -> list[State]:
+    """The running entries among `states`, newest first, or [None] if there are none."""
+    states = [state for state in states if state is not None]
+    states.sort(key=lambda state: state.get("start", ""), reverse=True)
+    return states or [None]
+
+def start_tags(tag: Optional[str]=None) -> list[str]:
+    """Tags of a new entry: `tag`, if any, and "btt-toggl" if TAG_ALL_ENTRIES."""
+    tags: list[str] = []
+    if tag:             tags.append(tag)
+    if TAG_ALL_ENTRIES: tags.append("btt-toggl")
+    return tags
+
+def start_json(wid: str, pid: str, tags: list[str]) -> dict:
+    """Build the POST body for a new running entry starting now."""
+    import time
+    from datetime import datetime
+    now = time.time()
+    start_rfc3339 = datetime.utcfromtimestamp(now).isoformat(timespec="seconds") + "Z"
+
+    return {"tags": tags, "start": start_rfc3339, "duration": -1 * int(now),
+            "workspace_id": int(wid), "project_id": int(pid), "created_with": "btt-toggl"}
+
+def start_request(wid: str, pid: str, tags: list[str]) -> tuple[str, dict, str]:
+    """URL, JSON body and API token of the POST starting a new entry."""
+    return START.format(wid), start_json(wid, pid, tags), token_for(wid, pid)
+
+def stop_request(state: STR_KEY_JSON) -> tuple[str, str]:
+    """URL and API token of the PATCH stopping `state`."""
+    return STOP.format(state['workspace_id'], state['id']), token_of(state)
+
+def tags_request(state: STR_KEY_JSON, tags: list[str]) -> tuple[str, dict, str]:
+    """URL, JSON body and API token of the PUT setting the tags of `state`."""
+    return TIME_ENTRY.format(state['workspace_id'], state['id']), dict(tags=tags), token_of(state)
+
+def with_tag(state: STR_KEY_JSON, tag: str) -> list[str]:
+    """Tags of `state` with `tag` added."""
+    tags: list[str] = list(state.get("tags") or list())
+    if tag not in tags: tags.append(tag)
+    return tags
+
+def without_tag(state: STR_KEY_JSON, tag: str) -> list[str]:
+    """Tags of `state` with `tag` removed."""
+    return [t for t in state.get("tags") or list() if t != tag]
@@ -1,44 +1,64 @@
-import os, sys, json
-
-from typing import Optional
-
-from btt_cache import write_cache
-from config import TAG_ALL_ENTRIES
-from utils import State, WID_PID_TYPE, wid_pid_tag_match, debug, info
-
-TIME_ENTRY = "https://api.track.toggl.com/api/v9/workspaces/{}/time_entries/{}"
-CURRENT = "https://api.track.toggl.com/api/v9/me/time_entries/current"
-START = "https://api.track.toggl.com/api/v9/workspaces/{}/time_entries"
-STOP = "https://api.track.toggl.com/api/v9/workspaces/{}/time_entries/{}/stop"
-PROJECTS = "https://api.track.toggl.com/api/v9/me/projects"
-
-if "--curl" in sys.argv:
-    from backends.curl import get, post, put, patch, NoInternetExceptions
-    debug("Using curl backend (forced)")
-elif "--requests" in sys.argv:
-    from backends.requests import get, post, put, patch, NoInternetExceptions
-    debug("Using requests backend (forced)")
-elif "--urllib" in sys.argv:
-    from backends.urllib import get, post, put, patch, NoInternetExceptions
-    debug("Using urllib backend (forced)")
-elif "--urllib3" in sys.argv:
-    from backends.urllib3 import get, post, put, patch, NoInternetExceptions
-    debug("Using urllib3 backend (forced)")
-elif "--pycurl" in sys.argv:
-    from backends.pycurl import get, post, put, patch, NoInternetExceptions
-    debug("Using pycurl backend (forced)")
-elif __name__ != "__main__":
-    from backends.curl import get, post, put, patch, NoInternetExceptions
-    debug("No backend specified, using curl through subprocess")
-else:
-    debug("Running toggl_api.py as script; not importing any backends")
+import sys, json, codecs
+
+from typing import Optional, Callable
+
+from utils import State, ACCOUNTS, API_TOKENS, wid_pid_tag_match, debug, info
+from btt_metrics import span
+from toggl_actions import (cache_action, on_account, newest_first, start_tags, start_request, stop_request, tags_request,
+                           with_tag, without_tag, CURRENT, PROJECTS)
+
+request_many = stream_many = None # only the pycurl backend can multiplex requests over one connection
+
+with span("import_backend"):
+    if "--curl" in sys.argv:
+        from backends.curl import get, post, put, patch, stream, NoInternetExceptions
+        debug("Using curl backend (forced)")
+    elif "--requests" in sys.argv:
+        from backends.requests import get, post, put, patch, stream, NoInternetExceptions
+        debug("Using requests backend (forced)")
+    elif "--urllib" in sys.argv:
+        from backends.urllib import get, post, put, patch, stream, NoInternetExceptions
+        debug("Using urllib backend (forced)")
+    elif "--urllib3" in sys.argv:
+        from backends.urllib3 import get, post, put, patch, stream, NoInternetExceptions
+        debug("Using urllib3 backend (forced)")
+    elif "--pycurl" in sys.argv:
+        from backends.pycurl import get, post, put, patch, stream, request_many, stream_many, NoInternetExceptions
+        debug("Using pycurl backend (forced)")
+    elif __name__ != "__main__":
+        from backends.curl import get, post, put, patch, stream, NoInternetExceptions
+        debug("No backend specified, using curl through subprocess")
+    else:
+        debug("Running toggl_api.py as script; not importing any backends")
+
+
+def send_many(calls: list[tuple[str, str, Optional[dict], str]]) -> list[State]:
+    """Send independent (method, url, json, token) requests concurrently: multiplexed over HTTP/2 with pycurl, otherwise on a thread pool."""
+    if request_many is not None:
+        return request_many(calls)
+
+    from concurrent.futures import ThreadPoolExecutor
+    methods = dict(GET=get, POST=post, PUT=put, PATCH=patch)
+    def send(call):
+        method, url, json, token = call
+        return methods[method](url, token=token) if method == "GET" else methods[method](url, json, token=token)
+    with span("http"), ThreadPoolExecutor(max_workers=len(calls)) as pool: # the backends' own spans do not count on worker threads
+        return list(pool.map(send, calls))
 
+def get_current_all() -> list[State]:
+    """Retrieve the current time entry of every account, newest first. Accounts are queried concurrently."""
+    if len(API_TOKENS) == 1:
+        return [on_account(get(CURRENT), API_TOKENS[0])]
+
+    debug("Getting current from %s accounts", len(API_TOKENS))
+    states = send_many([("GET", CURRENT, None, token) for token in API_TOKENS])
+    return newest_first([on_account(state, token) for state, token in zip(states, API_TOKENS)])
 
 def get_current(state: Optional[State]=None, force: bool=False) -> State:
-    """If `state` is None, retrieve the current time entry from Toggl."""
+    """If `state` is None, retrieve the current time entry from Toggl (the newest one, if several accounts are logging)."""
     if state is None or force:
         debug("Getting current from Toggl")
-        state = get(CURRENT)
+        state = get_current_all()[0]
         debug("Current: %s", str(state))
     else:
         debug("Using cached current")
@@ -48,21 +68,11 @@ def get_current(state: Optional[State]=None, force: bool=False) -> State:
 def start(wid: str, pid: str, tag: Optional[str]=None, cache: bool=False):
     """Start a new entry."""
     debug("Starting new entry (%s, %s, %s)", wid, pid, tag)
-    tags: list[str] = []
-    if tag:             tags.append(tag)
-    if TAG_ALL_ENTRIES: tags.append("btt-toggl")
-
-    import time
-    from datetime import datetime
-    now = time.time()
-    start_rfc3339 = datetime.utcfromtimestamp(now).isoformat(timespec="seconds") + "Z"
+    url, json_dict, token = start_request(wid, pid, start_tags(tag))
 
-    json_dict =  {"tags": tags, "start": start_rfc3339, "duration": -1 * int(now),
-                  "workspace_id": int(wid), "project_id": int(pid), "created_with": "btt-toggl"}
+    state = on_account(post(url, json_dict, token=token), token)
 
-    state = post(START.format(wid), json_dict)
-
-    return write_cache(state) if cache else state
+    return cache_action(state) if cache else state
 
 def stop(state: Optional[dict] = None, cache: bool=False):
     """Stop the current entry, if it exists."""
@@ -70,9 +80,10 @@ def stop(state: Optional[dict] = None, cache: bool=False):
     state = get_current(state)
     if state is None: return None
 
-    state = patch(STOP.format(state['workspace_id'], state['id']))
+    url, token = stop_request(state)
+    state = on_account(patch(url, token=token), token)
 
-    return write_cache(state) if cache else state
+    return cache_action(state) if cache else state
 
 def toggle(wid: str, pid: str, tag: Optional[str]=None, cache: bool=True):
     """Convenience function to toggle the current entry"""
@@ -82,12 +93,12 @@ def toggle(wid: str, pid: str, tag: Optional[str]=None, cache: bool=True):
         stopped = stop(state, cache=False)
 
         if wid_pid_tag_match(stopped, wid, pid, tag):
-            return write_cache(stopped)
+            return cache_action(stopped)
 
     # if there is no current trial, or if the current trial does not match wid/pid, start a new one.
     out = start(wid, pid, tag, cache=False)
 
-    return write_cache(out) if cache else out
+    return cache_action(out, state) if cache else out
 
 def add_tag(new_tag: str, state: Optional[dict]=None, cache: bool=True):
     """Add a tag to the current entry"""
@@ -95,14 +106,10 @@ def add_tag(new_tag: str, state: Optional[dict]=None, cache: bool=True):
     state = get_current(state)
     if state is None: return None
 
-    tags: list[str] = state.get("tags", list())
-    tags.append(new_tag)
-
-    json_dict = dict(tags=tags)
+    url, json_dict, token = tags_request(state, with_tag(state, new_tag))
+    state = on_account(put(url, json_dict, token=token), token)
 
-    state = put(TIME_ENTRY.format(state['workspace_id'], state['id']), json_dict)
-
-    return write_cache(state) if cache else state
+    return cache_action(state) if cache else state
 
 def remove_tag(old_tag: str, state: Optional[dict]=None, cache: bool=True):
     """Remove a tag from the current entry"""
@@ -110,15 +117,10 @@ def remove_tag(old_tag: str, state: Optional[dict]=None, cache: bool=True):
     state = get_current(state)
     if state is None: return None
 
-    tags: list[str] = state.get("tags", list())
-    if old_tag in tags:
-        tags = [t for t in tags if t != old_tag]
-
-    json_dict = dict(tags=tags)
+    url, json_dict, token = tags_request(state, without_tag(state, old_tag))
+    state = on_account(put(url, json_dict, token=token), token)
 
-    state = put(TIME_ENTRY.format(state['workspace_id'], state['id']), json_dict)
-
-    return write_cache(state) if cache else state
+    return cache_action(state) if cache else state
 
 def toggle_tag(tag: str, state: Optional[dict]=None, cache: bool=True):
     """Convenience function to toggle a tag"""
@@ -127,30 +129,121 @@ def toggle_tag(tag: str, state: Optional[dict]=None, cache: bool=True):
     state = get_current(state)
     if state is None: return None
 
-    tags: list[str] = state.get("tags", list())
-    if tag in tags:
+    if wid_pid_tag_match(state, tag=tag):
         state = remove_tag(tag, state, cache=False)
     else:
         state = add_tag(tag, state, cache=False)
 
-    return write_cache(state) if cache else state
-
-def get_project_dict() -> WID_PID_TYPE:
-    """ Query Toggl for all workspaces and projects """
+    return cache_action(state) if cache else state
+
+class ArrayStream:
+    """
+    Incremental parser for a JSON array of objects, fed the response body chunk by chunk. Each element is decoded
+    as soon as it is complete and only its `fields` are passed on to `on_item`, so memory is bounded by one chunk
+    and one element, not by the length of the array.
+    """
+
+    def __init__(self, fields: tuple[str, ...], on_item: Callable[[dict], None]):
+        self.fields = fields
+        self.on_item = on_item
+        self.decoder = json.JSONDecoder(parse_int=str)
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.started = self.done = False
+
+    def feed(self, chunk: bytes):
+        buffer = self.buffer + self.utf8.decode(chunk)
+        pos, end = 0, len(buffer)
+        while not self.done:
+            while pos < end and buffer[pos] in " \t\r\n,": pos += 1
+            if pos == end: break
+            if not self.started:
+                if buffer[pos] != "[": raise json.JSONDecodeError("Expected a JSON array", buffer, pos)
+                self.started, pos = True, pos + 1
+            elif buffer[pos] == "]":
+                self.done, pos = True, pos + 1
+            else:
+                try:
+                    item, pos = self.decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError: # element not complete yet
+                    break
+                self.on_item({field: item.get(field) for field in self.fields})
+        self.buffer = buffer[pos:]
+
+    def close(self):
+        """Raise if the body ended before the array did."""
+        if not self.done: raise json.JSONDecodeError("Incomplete JSON array", self.buffer, 0)
+
+def get_project_dict() -> None:
+    """ Query Toggl for the workspaces and projects of every account, and print them as WID_PID_DICT (and ACCOUNTS) definitions """
     debug("Getting WID_PID_DICT from Toggl")
-    projects = get(PROJECTS)
-    d: WID_PID_TYPE = dict()
-    for project in projects:
-        if project["wid"] not in d:
-            d[project["wid"]] = dict()
-        d[project["wid"]][project["id"]] = project["name"]
-    prefix = "WID_PID_DICT: dict[str, dict[str, str]] ="
-    d_str = "\n".join([" "*len(prefix) + line if i else line for i, line in enumerate(json.dumps(d, indent=2).splitlines())])
+    import threading
+    from shutil import get_terminal_size
+    from tempfile import SpooledTemporaryFile
+    from json.encoder import encode_basestring_ascii as quote
+    from config import API_TOKEN
+
+    # API token -> wid -> that workspace's project lines. projects can arrive in any workspace order,
+    # so each workspace's lines are spooled (in memory, then on disk) until the end
+    projects: dict[str, dict[str, SpooledTemporaryFile]] = {token: dict() for token in API_TOKENS}
+    lock = threading.Lock()
+    def parser(token: str) -> ArrayStream:
+        workspaces = projects[token]
+        def on_project(project: dict):
+            with lock:
+                f = workspaces.get(project["wid"])
+                if f is None:
+                    f = workspaces[project["wid"]] = SpooledTemporaryFile(max_size=64 * 1024, mode="w+")
+                f.write(f"{quote(project['id'])}: {quote(project['name'])}\n")
+        return ArrayStream(("wid", "id", "name"), on_project)
+
+    parsers = [parser(token) for token in API_TOKENS]
+    if len(API_TOKENS) == 1:
+        stream(PROJECTS, parsers[0].feed, token=API_TOKENS[0])
+    elif stream_many is not None: # each account's projects, multiplexed over one connection
+        stream_many([(PROJECTS, parser.feed, token) for parser, token in zip(parsers, API_TOKENS)])
+    else: # each account's projects, fetched concurrently
+        from concurrent.futures import ThreadPoolExecutor
+        with span("stream"), ThreadPoolExecutor(max_workers=len(API_TOKENS)) as pool:
+            list(pool.map(lambda call: stream(PROJECTS, call[0].feed, token=call[1]), zip(parsers, API_TOKENS)))
+    for parser in parsers: parser.close()
 
     debug("Printing WID_PID_DICT definition code")
-    print(f"{'~'*os.get_terminal_size().columns}\n\n{prefix} {d_str}\n\n{'~'*os.get_terminal_size().columns}", flush=True)
-    info("Copy the above code into your config file, replacing the placeholder WID_PID_DICT definition (on line 18). Feel free to change the descriptions associated with each project.")
-    return d
+    out = sys.stdout
+    def write_projects(workspaces: dict[str, SpooledTemporaryFile], pad: str):
+        # same layout as json.dumps(WID_PID_DICT, indent=2) with every line after the first indented by `pad`, written one line at a time
+        out.write("{" if workspaces else "{}")
+        for i, (wid, f) in enumerate(workspaces.items()):
+            out.write(f"{',' if i else ''}\n{pad}  {quote(wid)}: {{")
+            f.seek(0)
+            for j, project in enumerate(f):
+                out.write(f"{',' if j else ''}\n{pad}    {project[:-1]}")
+            out.write(f"\n{pad}  }}")
+        if workspaces: out.write(f"\n{pad}}}")
+
+    # one definition per account, in the layout of config.py: API_TOKEN's projects in WID_PID_DICT, the others' in ACCOUNTS
+    line = "~" * get_terminal_size().columns
+    prefix = "WID_PID_DICT: dict[str, dict[str, str]] ="
+    out.write(f"{line}\n\n{prefix} ")
+    write_projects(projects[API_TOKEN], " " * len(prefix))
+    if ACCOUNTS:
+        prefix = "ACCOUNTS: dict[str, dict] ="
+        pad = " " * len(prefix)
+        out.write(f"\n\n{prefix} {{")
+        for i, (name, account) in enumerate(ACCOUNTS.items()):
+            out.write(f"{',' if i else ''}\n{pad}  {quote(name)}: {{\n{pad}    \"API_TOKEN\": {quote(account['API_TOKEN'])},\n{pad}    \"WID_PID_DICT\": ")
+            write_projects(projects[account["API_TOKEN"]], pad + "    ")
+            out.write(f"\n{pad}  }}")
+        out.write(f"\n{pad}}}")
+    out.write(f"\n\n{line}\n")
+    out.flush()
+    for workspaces in projects.values():
+        for f in workspaces.values(): f.close()
+
+    if ACCOUNTS:
+        info("Copy the above code into your config file, replacing the WID_PID_DICT and ACCOUNTS definitions. Feel free to change the descriptions associated with each project.")
+    else:
+        info("Copy the above code into your config file, replacing the placeholder WID_PID_DICT definition (on line 18). Feel free to change the descriptions associated with each project.")
 
 
 def backend_test(verbose: bool=False):
@@ -0,0 +1,117 @@
+"""
+asyncio counterparts of the toggl_api functions, for long-running callers (servers, pollers) that want
+several requests in flight at once. Requests go through the keep-alive connection pool in backends/aio.py,
+which bounds concurrency and applies TIMEOUT per request. The CLI keeps using the blocking toggl_api.
+The requests and tag lists are built by the same helpers as in toggl_api (toggl_actions, which loads no
+blocking backend); only the I/O differs. Cache writes run in a worker thread, off the event loop.
+
+    import asyncio, toggl_async
+
+    async def main():
+        try:
+            await toggl_async.toggle(wid, pid)
+        finally:
+            await toggl_async.close()
+
+    asyncio.run(main())
+"""
+import asyncio
+
+from typing import Optional
+
+from utils import State, API_TOKENS, wid_pid_tag_match, debug
+from toggl_actions import (cache_action, on_account, newest_first, start_tags, start_request, stop_request, tags_request,
+                           with_tag, without_tag, CURRENT)
+from backends.aio import get, post, put, patch, pool, NoInternetExceptions
+
+
+async def get_current_all() -> list[State]:
+    """Retrieve the current time entry of every account concurrently, newest first."""
+    states = await asyncio.gather(*(get(CURRENT, token=token) for token in API_TOKENS))
+    return newest_first([on_account(state, token) for state, token in zip(states, API_TOKENS)])
+
+async def get_current(state: Optional[State]=None, force: bool=False) -> State:
+    """If `state` is None, retrieve the current time entry from Toggl (the newest one, if several accounts are logging)."""
+    if state is None or force:
+        debug("Getting current from Toggl")
+        state = (await get_current_all())[0]
+        debug("Current: %s", str(state))
+    else:
+        debug("Using cached current")
+
+    return state
+
+async def start(wid: str, pid: str, tag: Optional[str]=None, cache: bool=False):
+    """Start a new entry."""
+    debug("Starting new entry (%s, %s, %s)", wid, pid, tag)
+    url, json_dict, token = start_request(wid, pid, start_tags(tag))
+
+    state = on_account(await post(url, json_dict, token=token), token)
+
+    return await asyncio.to_thread(cache_action, state) if cache else state
+
+async def stop(state: Optional[dict] = None, cache: bool=False):
+    """Stop the current entry, if it exists."""
+    debug("Stopping current entry")
+    state = await get_current(state)
+    if state is None: return None
+
+    url, token = stop_request(state)
+    state = on_account(await patch(url, token=token), token)
+
+    return await asyncio.to_thread(cache_action, state) if cache else state
+
+async def toggle(wid: str, pid: str, tag: Optional[str]=None, cache: bool=True):
+    """Convenience function to toggle the current entry"""
+    debug("Toggling (%s, %s, %s)", wid, pid, tag)
+    state = await get_current()
+    if state is not None:
+        stopped = await stop(state, cache=False)
+
+        if wid_pid_tag_match(stopped, wid, pid, tag):
+            return await asyncio.to_thread(cache_action, stopped)
+
+    # if there is no current trial, or if the current trial does not match wid/pid, start a new one.
+    out = await start(wid, pid, tag, cache=False)
+
+    return await asyncio.to_thread(cache_action, out, state) if cache else out
+
+async def add_tag(new_tag: str, state: Optional[dict]=None, cache: bool=True):
+    """Add a tag to the current entry"""
+    debug("Adding tag %s to current entry", new_tag)
+    state = await get_current(state)
+    if state is None: return None
+
+    url, json_dict, token = tags_request(state, with_tag(state, new_tag))
+    state = on_account(await put(url, json_dict, token=token), token)
+
+    return await asyncio.to_thread(cache_action, state) if cache else state
+
+async def remove_tag(old_tag: str, state: Optional[dict]=None, cache: bool=True):
+    """Remove a tag from the current entry"""
+    debug("Removing tag %s from current entry", old_tag)
+    state = await get_current(state)
+    if state is None: return None
+
+    url, json_dict, token = tags_request(state, without_tag(state, old_tag))
+    state = on_account(await put(url, json_dict, token=token), token)
+
+    return await asyncio.to_thread(cache_action, state) if cache else state
+
+async def toggle_tag(tag: str, state: Optional[dict]=None, cache: bool=True):
+    """Convenience function to toggle a tag"""
+    debug("Toggling tag %s on current entry", tag)
+
+    state = await get_current(state)
+    if state is None: return None
+
+    if wid_pid_tag_match(state, tag=tag):
+        state = await remove_tag(tag, state, cache=False)
+    else:
+        state = await add_tag(tag, state, cache=False)
+
+    return await asyncio.to_thread(cache_action, state) if cache else state
+
+async def close():
+    """Close the pooled connections of the running event loop."""
+    await pool.close()
@@ -0,0 +1,80 @@
+"""
+Micro-benchmark of write_cache over a large WID_PID_DICT, comparing the string template in utils.render_status
+and the active-project set lookup with the previous make_status (match + dict + json.dumps per project).
+
+    python tools/bench_status.py --workspaces 5 --projects 100
+"""
+import sys, json, time, argparse, tempfile
+
+from pathlib import Path
+from typing import Optional
+
+REPO = Path(__file__).parent.parent.absolute()
+
+parser = argparse.ArgumentParser(description="Benchmark write_cache throughput")
+parser.add_argument("--workspaces", type=int, default=5)
+parser.add_argument("--projects", type=int, default=100, help="projects per workspace")
+parser.add_argument("--repeat", type=int, default=200, help="write_cache calls per measurement")
+args = parser.parse_args()
+
+# a throwaway config.py with a large WID_PID_DICT, imported instead of the user's
+sandbox = Path(tempfile.mkdtemp(prefix="btt-toggl-bench-"))
+wid_pid_dict = {str(1000000 * (w + 1)): {str(100000000 * (w + 1) + p + 1): f"W{w + 1} P{p + 1}" for p in range(args.projects)}
+                for w in range(args.workspaces)}
+(sandbox / "config.py").write_text(f"""
+PATH_TO_ACTIVE_IMG = {(REPO / 'images' / 'active.png').as_posix()!r}
+PATH_TO_INACTIVE_IMG = {(REPO / 'images' / 'inactive.png').as_posix()!r}
+PATH_TO_CACHE_FILE = {(sandbox / 'cache.json').as_posix()!r}
+API_TOKEN = "0a0a0a0a0a0a0a0a0a0a0a0a0a0a0a0a"
+WID_PID_DICT = {wid_pid_dict!r}
+""")
+sys.path[:0] = [sandbox.as_posix(), REPO.as_posix()]
+
+from utils import wid_pid_tag_match, CACHE_TYPE, WID_PID_DICT
+from btt_cache import write_cache
+from config import PATH_TO_ACTIVE_IMG, PATH_TO_INACTIVE_IMG, PATH_TO_CACHE_FILE
+
+
+def legacy_make_status(data: Optional[dict]=None, general: bool=False, wid: Optional[str]=None, pid: Optional[str]=None, tag: Optional[str]=None):
+    """make_status before the string template."""
+    active = bool(data) if general and tag is None else bool(wid_pid_tag_match(data, wid, pid, tag))
+    icon_path = PATH_TO_ACTIVE_IMG if active else PATH_TO_INACTIVE_IMG
+    text = WID_PID_DICT[wid][pid]
+    if tag: text += f": {tag}"
+    return json.dumps({"text": text, "icon_path": icon_path})
+
+def legacy_write_cache(state):
+    """write_cache before the string template and the active-project set."""
+    d: CACHE_TYPE = dict()
+    for wid, pids in WID_PID_DICT.items():
+        d[wid] = {}
+        for pid in pids.keys():
+            d[wid][pid] = legacy_make_status(state, False, wid, pid)
+    if state is not None:
+        d["tags"] = state.get("tags", list())
+    with open(PATH_TO_CACHE_FILE, "w") as f: json.dump(d, f)
+    return state
+
+def bench(fn, state) -> float:
+    """Seconds per call."""
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        fn(state)
+    return (time.perf_counter() - start) / args.repeat
+
+
+wid, pid = next(iter(wid_pid_dict)), next(iter(wid_pid_dict[next(iter(wid_pid_dict))]))
+state = {"id": "1", "workspace_id": wid, "project_id": pid, "tags": ["btt-toggl"]}
+
+# both versions must write the same cache
+legacy_write_cache(state)
+expected = Path(PATH_TO_CACHE_FILE).read_text()
+write_cache(state)
+assert Path(PATH_TO_CACHE_FILE).read_text() == expected, "render_status output differs from make_status"
+
+projects = args.workspaces * args.projects
+print(f"write_cache over {projects} projects, {args.repeat} calls each")
+legacy = bench(legacy_write_cache, state)
+current = bench(write_cache, state)
+for name, seconds in [("make_status (before)", legacy), ("render_status", current)]:
+    print(f"{name:<22}{1000 * seconds:>9.3f} ms/call {1 / seconds:>9.1f} calls/s {legacy / seconds:>6.2f}x")
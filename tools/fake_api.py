@@ -0,0 +1,186 @@
+import re, sys, json, time, threading
+
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+TIME_ENTRY = re.compile(r"^/workspaces/(\d+)/time_entries/(\d+)$")
+START = re.compile(r"^/workspaces/(\d+)/time_entries$")
+STOP = re.compile(r"^/workspaces/(\d+)/time_entries/(\d+)/stop$")
+
+
+class FakeToggl:
+    """In-memory stand-in for the parts of the Toggl API v9 that btt-toggl uses."""
+
+    def __init__(self, wid_pid_dict: dict[str, dict[str, str]], delay: float=0.0):
+        self.wid_pid_dict = wid_pid_dict
+        self.delay = delay # seconds to sleep per request, to mimic network latency
+        self.current: dict[str, dict] = dict() # Authorization header (i.e. account) -> running entry
+        self.next_id = 1
+        self.calls: Counter = Counter() # "<METHOD> <route>" -> count
+        self.protocols: Counter = Counter() # "HTTP/1.1"/"HTTP/2" -> requests served with it
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def handle(self, method: str, path: str, body: Optional[dict], account: str=""):
+        """Return the JSON response for one request of `account`, or raise KeyError for unknown routes."""
+        if self.delay: time.sleep(self.delay)
+        path = path.split("?")[0]
+        if path.startswith("/api/v9"): path = path[len("/api/v9"):]
+
+        with self.lock:
+            if method == "GET" and path == "/me/time_entries/current":
+                self.calls["GET current"] += 1
+                return self.current.get(account)
+            if method == "GET" and path == "/me/projects":
+                self.calls["GET projects"] += 1
+                return [{"id": int(pid), "wid": int(wid), "workspace_id": int(wid), "name": name, "active": True}
+                        for wid, pids in self.wid_pid_dict.items() for pid, name in pids.items()]
+            if method == "POST" and START.match(path):
+                self.calls["POST start"] += 1
+                if account in self.current: self.current[account]["stop"] = now()
+                current = self.current[account] = {"id": self.next_id, "workspace_id": int(body["workspace_id"]), "project_id": int(body["project_id"]),
+                                "tags": list(body.get("tags") or []), "start": body.get("start", now()), "duration": body.get("duration", -1)}
+                self.next_id += 1
+                return current
+            if method == "PATCH" and STOP.match(path):
+                self.calls["PATCH stop"] += 1
+                return self.stop(account, int(STOP.match(path).group(2)))
+            if method == "PUT" and TIME_ENTRY.match(path):
+                self.calls["PUT entry"] += 1
+                entry_id = int(TIME_ENTRY.match(path).group(2))
+                current = self.current.get(account)
+                if current is None or current["id"] != entry_id: return None
+                current["tags"] = list((body or {}).get("tags") or [])
+                return current
+        raise KeyError(f"{method} {path}")
+
+    def stop(self, account: str, entry_id: int):
+        current = self.current.get(account)
+        if current is None or current["id"] != entry_id: return None
+        del self.current[account]
+        return dict(current, stop=now())
+
+def now() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+def call(api: FakeToggl, method: str, path: str, body: Optional[bytes], account: str="") -> tuple[int, bytes]:
+    """Status code and JSON body of the response to one request."""
+    try:
+        return 200, json.dumps(api.handle(method, path, json.loads(body) if body else None, account)).encode("utf-8")
+    except KeyError as e:
+        return 404, json.dumps(f"unknown route {e}").encode("utf-8")
+
+def make_handler(api: FakeToggl, http2: bool=False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # keep-alive, like the real API
+
+        def setup(self):
+            super().setup()
+            with api.lock: api.connections += 1
+
+        def respond(self, method: str):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else None
+            if http2 and self.headers.get("Upgrade", "").lower() == "h2c":
+                return self.serve_h2(method, body)
+
+            with api.lock: api.protocols["HTTP/1.1"] += 1
+            status, out = call(api, method, self.path, body, self.headers.get("Authorization", ""))
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def serve_h2(self, method: str, body: Optional[bytes]):
+            """Switch this connection to HTTP/2 (h2c upgrade), answer the upgraded request as stream 1, then serve streams until the client hangs up."""
+            conn = H2Connection(H2Configuration(client_side=False, header_encoding="utf-8"))
+            lock = threading.Lock()
+            self.wfile.write(b"HTTP/1.1 101 Switching Protocols\r\nConnection: Upgrade\r\nUpgrade: h2c\r\n\r\n")
+            self.wfile.flush()
+            conn.initiate_upgrade_connection(self.headers["HTTP2-Settings"])
+            self.connection.sendall(conn.data_to_send())
+            self.close_connection = True
+
+            def answer(stream_id: int, method: str, path: str, body: Optional[bytes], account: str):
+                # streams are answered on their own threads, so a slow request does not hold up the others on this connection
+                with api.lock: api.protocols["HTTP/2"] += 1
+                status, out = call(api, method, path, body, account)
+                with lock:
+                    conn.send_headers(stream_id, [(":status", str(status)), ("content-type", "application/json"), ("content-length", str(len(out)))])
+                    frames = range(0, len(out), conn.max_outbound_frame_size) # responses are assumed to fit in the flow control window
+                    for i in frames: conn.send_data(stream_id, out[i:i + conn.max_outbound_frame_size], end_stream=i == frames[-1])
+                    if not out: conn.end_stream(stream_id)
+                    self.connection.sendall(conn.data_to_send())
+
+            threading.Thread(target=answer, args=(1, method, self.path, body, self.headers.get("Authorization", "")), daemon=True).start()
+            streams: dict[int, tuple[dict, bytearray]] = dict()
+            while True:
+                data = self.rfile.read1(65535)
+                if not data: return
+                with lock:
+                    events = conn.receive_data(data)
+                    for event in events:
+                        if isinstance(event, h2.events.RequestReceived):
+                            streams[event.stream_id] = (dict(event.headers), bytearray())
+                        elif isinstance(event, h2.events.DataReceived):
+                            streams[event.stream_id][1].extend(event.data)
+                            conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                        elif isinstance(event, h2.events.StreamEnded) and event.stream_id in streams:
+                            headers, body = streams.pop(event.stream_id)
+                            threading.Thread(target=answer, args=(event.stream_id, headers[":method"], headers[":path"], bytes(body), headers.get("authorization", "")), daemon=True).start()
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                    self.connection.sendall(conn.data_to_send())
+
+        def do_GET(self): self.respond("GET")
+        def do_POST(self): self.respond("POST")
+        def do_PUT(self): self.respond("PUT")
+        def do_PATCH(self): self.respond("PATCH")
+
+        def log_message(self, *args): pass
+
+    return Handler
+
+def serve(api: FakeToggl, port: int=0, http2: bool=False) -> ThreadingHTTPServer:
+    """
+    Start serving `api` on 127.0.0.1:`port` (0 picks a free port) in a daemon thread.
+    With `http2`, clients asking for an h2c upgrade are switched to HTTP/2; others keep using HTTP/1.1.
+    """
+    if http2: import_h2()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(api, http2))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def import_h2():
+    global h2, H2Connection, H2Configuration
+    try:
+        import h2.events
+        from h2.connection import H2Connection
+        from h2.config import H2Configuration
+    except ImportError as e:
+        print(f"HTTP/2 stand-in needs the `h2` package. Install with: \n\t {sys.executable} -m pip install h2", flush=True)
+        raise e
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve a fake Toggl API v9 for btt-toggl. Point btt-toggl at it with BTT_TOGGL_API=http://127.0.0.1:<port>")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds of simulated latency per request")
+    parser.add_argument("--h2", action="store_true", help="accept h2c upgrades to HTTP/2 (needs the h2 package)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(__import__("pathlib").Path(__file__).parent.parent))
+    from config import WID_PID_DICT
+
+    server = serve(FakeToggl(WID_PID_DICT, args.delay), args.port, args.h2)
+    print(f"Fake Toggl API on http://127.0.0.1:{server.server_port}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,176 @@
+"""
+Simulate N touch bar widgets polling btt-toggl.py against a local fake Toggl API, and report what it costs.
+
+    python tools/load_sim.py --widgets 20 --duration 60                      # run and print a report
+    python tools/load_sim.py --widgets 20 --save-baseline tools/baseline.json # record thresholds on this machine
+    python tools/load_sim.py --widgets 20 --baseline tools/baseline.json      # exit 1 if per-tick cost regressed
+
+The widget mix matches a typical setup: one general `status` widget (which refreshes the cache),
+and the rest split between (wid, pid), tag and tag+project `status` widgets. Each click-able widget
+occasionally fires its `toggle`/`toggle_tag` action.
+"""
+import os, sys, json, time, random, shutil, argparse, resource, tempfile, threading, subprocess
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fake_api import FakeToggl, serve
+
+REPO = Path(__file__).parent.parent.absolute()
+TAGS = ["meeting", "deep-work", "admin"]
+
+CONFIG = """
+PATH_TO_ACTIVE_IMG = {active!r}
+PATH_TO_INACTIVE_IMG = {inactive!r}
+PATH_TO_CACHE_FILE = {cache!r}
+TAG_ACTIVE_BACKGROUND_RGB = "223,51,54"
+TAG_INACTIVE_BACKGROUND_RGB = "85,85,85"
+API_TOKEN = "0a0a0a0a0a0a0a0a0a0a0a0a0a0a0a0a"
+WID_PID_DICT = {wid_pid_dict!r}
+TAG_ALL_ENTRIES = True
+VALIDATION = False
+TIMEOUT = 5
+"""
+
+# metric -> allowed relative increase over the baseline before the run counts as a regression
+TOLERANCE = {"cpu_per_call_ms": 0.25, "p95_ms": 0.50, "api_calls_per_tick": 0.25}
+
+
+def make_sandbox(workspaces: int, projects: int) -> tuple[Path, dict]:
+    """Copy btt-toggl into a temp dir with its own config.py, so the user's config and cache are never touched."""
+    root = Path(tempfile.mkdtemp(prefix="btt-toggl-load-"))
+    shutil.copytree(REPO, root, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(".git", "__pycache__", "config.py", "cache.json", "*.ndjson", "tools", "readme_img"))
+    wid_pid_dict = {str(1000000 * (w + 1)): {str(100000000 * (w + 1) + p + 1): f"W{w + 1} P{p + 1}" for p in range(projects)}
+                    for w in range(workspaces)}
+    (root / "config.py").write_text(CONFIG.format(active=(root / "images" / "active.png").as_posix(),
+                                                  inactive=(root / "images" / "inactive.png").as_posix(),
+                                                  cache=(root / "cache.json").as_posix(), wid_pid_dict=wid_pid_dict))
+    return root, wid_pid_dict
+
+def make_widgets(n: int, wid_pid_dict: dict) -> list[tuple[str, list[str], list[str]]]:
+    """Return (kind, status args, click args) for n widgets: one general, then (wid, pid), tag and tag+project in a 3:1:1 ratio."""
+    projects = [(wid, pid) for wid, pids in wid_pid_dict.items() for pid in pids]
+    widgets = [("general", ["status"], [])]
+    for i in range(n - 1):
+        wid, pid = projects[i % len(projects)]
+        tag = TAGS[i % len(TAGS)]
+        kind = ("project", "project", "project", "tag", "tag+project")[i % 5]
+        if kind == "project":
+            widgets.append((kind, ["status", "-w", wid, "-p", pid], ["toggle", "-w", wid, "-p", pid]))
+        elif kind == "tag":
+            widgets.append((kind, ["status", "-t", tag], ["toggle_tag", "-t", tag]))
+        else:
+            widgets.append((kind, ["status", "-w", wid, "-p", pid, "-t", tag], ["toggle", "-w", wid, "-p", pid, "-t", tag]))
+    return widgets
+
+def percentile(values: list[float], p: float) -> float:
+    from math import ceil
+    values = sorted(values)
+    return values[max(0, ceil(p / 100 * len(values)) - 1)] if values else 0.0
+
+def run(args) -> dict:
+    root, wid_pid_dict = make_sandbox(args.workspaces, args.projects)
+    api = FakeToggl(wid_pid_dict, delay=args.delay)
+    server = serve(api)
+    env = dict(os.environ, BTT_TOGGL_API=f"http://127.0.0.1:{server.server_port}")
+    env.pop("PYTHONPATH", None)
+    script = (root / "btt-toggl.py").as_posix()
+    backend = [f"--{args.backend}"] if args.backend else []
+
+    latencies: dict[str, list[float]] = dict()
+    clicks, errors = [0], [0]
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+    rng = random.Random(args.seed)
+
+    def call(kind: str, argv: list[str]):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, script, *argv, *backend], env=env, capture_output=True)
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.setdefault(kind, list()).append(elapsed)
+            if proc.returncode or proc.stderr: errors[0] += 1
+
+    def widget(kind: str, status: list[str], click: list[str], offset: float, seed: int):
+        wrng = random.Random(seed)
+        time.sleep(offset) # BTT does not start every widget at the same instant
+        while time.monotonic() < stop_at:
+            tick = time.monotonic()
+            call(kind, status)
+            if click and wrng.random() < args.click_rate:
+                call(click[0], click)
+                with lock: clicks[0] += 1
+            time.sleep(max(0.0, args.interval - (time.monotonic() - tick)))
+
+    # make sure the cache exists before the non-general widgets read it
+    call("general", ["status"])
+    latencies.clear()
+    api.calls.clear()
+
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started = time.monotonic()
+    threads = [threading.Thread(target=widget, args=(kind, status, click, rng.uniform(0, args.interval), rng.random()))
+               for kind, status, click in make_widgets(args.widgets, wid_pid_dict)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    server.shutdown()
+    shutil.rmtree(root, ignore_errors=True)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    all_latencies = [v for values in latencies.values() for v in values]
+    ticks = sum(len(v) for k, v in latencies.items() if k in ("general", "project", "tag", "tag+project"))
+    api_calls = sum(api.calls.values())
+
+    return {
+        "widgets": args.widgets, "interval": args.interval, "duration": round(wall, 2), "backend": args.backend or "default",
+        "calls": len(all_latencies), "status_ticks": ticks, "clicks": clicks[0], "errors": errors[0],
+        "cpu_seconds_per_minute": round(cpu / wall * 60, 3),
+        "cpu_per_call_ms": round(1000 * cpu / max(1, len(all_latencies)), 3),
+        "p50_ms": round(1000 * percentile(all_latencies, 50), 2),
+        "p95_ms": round(1000 * percentile(all_latencies, 95), 2),
+        "p99_ms": round(1000 * percentile(all_latencies, 99), 2),
+        "per_kind_p95_ms": {kind: round(1000 * percentile(values, 95), 2) for kind, values in sorted(latencies.items())},
+        "api_calls": api_calls, "api_calls_by_route": dict(api.calls),
+        "api_calls_per_tick": round(api_calls / max(1, ticks), 4),
+    }
+
+def check(result: dict, baseline: dict) -> list[str]:
+    """Return a message for each metric that got worse than baseline * (1 + tolerance)."""
+    failures = []
+    for metric, tolerance in TOLERANCE.items():
+        limit = baseline[metric] * (1 + tolerance)
+        if result[metric] > limit + 1e-9:
+            failures.append(f"{metric} regressed: {result[metric]} > {round(limit, 3)} (baseline {baseline[metric]}, tolerance {tolerance:.0%})")
+    if result["errors"]:
+        failures.append(f"{result['errors']} calls failed")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-widget polling load simulator for btt-toggl", usage=__doc__)
+    parser.add_argument("--widgets", type=int, default=10, help="number of simulated widgets (including the general status widget)")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls of each widget")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds to run for")
+    parser.add_argument("--click-rate", type=float, default=0.02, help="probability per tick that a widget's action fires")
+    parser.add_argument("--workspaces", type=int, default=2)
+    parser.add_argument("--projects", type=int, default=5, help="projects per workspace")
+    parser.add_argument("--delay", type=float, default=0.0, help="simulated API latency per request, in seconds")
+    parser.add_argument("--backend", choices=["curl", "requests", "urllib", "urllib3", "pycurl"], default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, help="fail if the run is worse than this baseline")
+    parser.add_argument("--save-baseline", type=Path, help="write this run's results as the new baseline")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(json.dumps(result, indent=2), flush=True)
+
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(result, indent=2) + "\n")
+        print(f"Saved baseline to {args.save_baseline}", flush=True)
+    if args.baseline:
+        failures = check(result, json.loads(args.baseline.read_text()))
+        for failure in failures: print(failure, file=sys.stderr, flush=True)
+        sys.exit(1 if failures else 0)
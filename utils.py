@@ -1,15 +1,34 @@
-import sys, json
+import sys
 
 from functools import partial
 from typing import Optional, Union
+from json.encoder import encode_basestring_ascii
 
-from config import WID_PID_DICT, PATH_TO_ACTIVE_IMG, PATH_TO_INACTIVE_IMG
+from config import WID_PID_DICT, API_TOKEN, PATH_TO_ACTIVE_IMG, PATH_TO_INACTIVE_IMG
+try:
+    from config import ACCOUNTS
+except ImportError: # config.py from before multi-account support
+    ACCOUNTS = dict()
 
 WID_PID_TYPE = dict[str, dict[str, str]] # JSON {wid -> {pid -> display name, ...}}
-CACHE_TYPE = dict[str, Union[dict[str, str], list[str]]] # JSON {wid -> {pid -> style string, ...}, ..., tags}
+CACHE_TYPE = dict[str, Union[dict[str, str], list]] # JSON {wid -> {pid -> style string, ...}, ..., tags, entries (with several accounts)}
 STR_KEY_JSON = dict[str, Union[dict, list, str, bool, type(None)]] # JSON with string keys
 State = Optional[STR_KEY_JSON] # JSON if currently logging, None otherwise
 
+# merge the projects of every account into one WID_PID_DICT (a workspace shared by several accounts gets the projects
+# of all of them), and remember which API token lists each project, to start entries on the right account
+TOKENS: dict[str, str] = dict.fromkeys(WID_PID_DICT, API_TOKEN) # wid -> API token of the first account listing it
+PROJECT_TOKENS: dict[tuple[str, str], str] = dict() # (wid, pid) -> API token of the first account listing it, with ACCOUNTS
+if ACCOUNTS:
+    PROJECT_TOKENS = {(wid, pid): API_TOKEN for wid, pids in WID_PID_DICT.items() for pid in pids}
+    WID_PID_DICT = {wid: dict(pids) for wid, pids in WID_PID_DICT.items()}
+    for account in ACCOUNTS.values():
+        for wid, pids in account["WID_PID_DICT"].items():
+            WID_PID_DICT.setdefault(wid, dict()).update(pids)
+            TOKENS.setdefault(wid, account["API_TOKEN"])
+            for pid in pids: PROJECT_TOKENS.setdefault((wid, pid), account["API_TOKEN"])
+API_TOKENS: list[str] = list(dict.fromkeys([API_TOKEN, *(account["API_TOKEN"] for account in ACCOUNTS.values())]))
+
 USAGE = """
     btt-toggl.py status                             # prints general BTT style string (active if logging any project)
     btt-toggl.py status -w <wid> -p <pid>           # prints BTT style string for <wid> <pid> (active only if logging <wid> <pid>)
@@ -23,13 +42,17 @@ USAGE = """
     btt-toggl.py add_tag -t <tag>                   # adds tag to current entry
     btt-toggl.py remove_tag -t <tag>                # removes tag from current entry
 
-    btt-toggl.py get_project_dict                   # gets workspaces and projects from Toggl and prints them in a format that can be copied into config.py for WID_PID_DICT
+    btt-toggl.py batch "<op>" "<op>" ...            # runs several of the above actions (e.g. "stop" "start -w <wid> -p <pid>" "add_tag -t <tag>") with as few requests as possible. use "-" to read ops from stdin (one per line or separated by ;)
+
+    btt-toggl.py get_project_dict                   # gets workspaces and projects from Toggl and prints them in a format that can be copied into config.py for WID_PID_DICT (and ACCOUNTS)
+    btt-toggl.py stats --window <minutes>           # prints p50/p95/p99 timings per mode and phase recorded with --metrics (default: last 60 minutes)
     btt-toggl.py -h                                 # shows help message
 
     Options:
         --debug                                     # prints debug messages
         --info                                      # prints info messages
         --no-validation                             # skips validation of command line arguments, paths, etc.
+        --metrics                                   # appends per-phase timings to the metrics log
         --curl                                      # uses curl backend
         --requests                                  # uses requests backend (default if available)
         --urllib                                    # uses urllib backend
@@ -39,8 +62,10 @@ USAGE = """
 
 send_to_btt = partial(print, flush=True, file=sys.stdout)
 
+DEBUG = "--debug" in sys.argv
+
 logging_kwargs = None
-if "--debug" in sys.argv:
+if DEBUG:
     logging_kwargs = dict(level="DEBUG", format="%(message)s", datefmt="[%X]")
 elif "--info" in sys.argv or "get_project_dict" in sys.argv:
     logging_kwargs = dict(level="INFO", format="%(message)s", datefmt="[%X]")
@@ -60,14 +85,15 @@ else:
 def wid_pid_tag_match(data: Optional[dict]=None, wid: Optional[str]=None, pid: Optional[str]=None, tag: Optional[str]=None) -> bool:
     """Returns True if wid and pid and tag (if supplied) match the current entry."""
     if data is None: return
-    debug("Checking if wid/pid/tag match (%s, %s, %s) vs data %s, %s, %s", wid, pid, tag, data.get("workspace_id"), data.get("project_id"), str(data.get("tags", list())))
+    # guarded so the arguments are not built when debug logging is off
+    if DEBUG: debug("Checking if wid/pid/tag match (%s, %s, %s) vs data %s, %s, %s", wid, pid, tag, data.get("workspace_id"), data.get("project_id"), str(data.get("tags", list())))
 
     pid_match = (not pid) or ("project_id" in data and data["project_id"] == pid)
     wid_match = (not wid) or ("workspace_id" in data and data["workspace_id"] == wid)
     tag_match = (not tag) or ("tags" in data and tag in data["tags"])
 
     match = wid_match and pid_match and tag_match
-    debug("Matched" if match else f"No match ({wid_match=}, {pid_match=}, {tag_match=})")
+    if DEBUG: debug("Matched" if match else f"No match ({wid_match=}, {pid_match=}, {tag_match=})")
 
     return match
 
@@ -80,16 +106,22 @@ def make_status(data: Optional[dict]=None, general: bool=False, wid: Optional[st
     else:
         active = False
 
-    debug("Making %s style string %s", "active" if active else "inactive", "" if general else ("for " + str((wid, pid))))
+    if DEBUG: debug("Making %s style string %s", "active" if active else "inactive", "" if general else ("for " + str((wid, pid))))
+
+    status_string = render_status(None, None, tag, active) if general else render_status(wid, pid, tag, active)
+    if DEBUG: debug("Status string: %s", status_string)
+
+    return status_string
+
+# same output as json.dumps({"text": text, "icon_path": icon_path}), without building a dict per call
+STATUS_TEMPLATE = '{"text": %s, "icon_path": %s}'
+ICON_PATHS = {True: encode_basestring_ascii(PATH_TO_ACTIVE_IMG), False: encode_basestring_ascii(PATH_TO_INACTIVE_IMG)}
 
-    icon_path = PATH_TO_ACTIVE_IMG if active else PATH_TO_INACTIVE_IMG
-    if not general:
+def render_status(wid: Optional[str], pid: Optional[str], tag: Optional[str], active: bool) -> str:
+    """BTT style string for project (wid, pid), or for the general status if wid is None."""
+    if wid is not None:
         text = WID_PID_DICT[wid][pid]
         if tag: text += f": {tag}"
     else:
         text = tag or " "
-
-    status_string = json.dumps({"text": text, "icon_path": icon_path})
-    debug("Status string: %s", status_string)
-
-    return status_string
+    return STATUS_TEMPLATE % (encode_basestring_ascii(text), ICON_PATHS[active])